@@ -0,0 +1,87 @@
+"""
+Listing search benchmark: query latency and top-1 accuracy on a synthetic tire catalog
+
+Builds a ListingIndex over generated listing names (brand, model line and tire
+size), then searches for names of known listings, some of them with a typo or an
+extra word as in our feeds, and checks that the source listing comes first.
+
+Usage: python benchmarks/bench_matching.py [listings] [queries]
+"""
+import os
+import sys
+import json
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import ListingIndex
+
+BRANDS = ["Michelin", "Pirelli", "Continental", "Nokian", "Goodyear", "Yokohama", "Bridgestone", "Hankook",
+          "Kumho", "Toyo", "Dunlop", "Nexen", "Cordiant", "Triangle", "Sailun", "Kormoran", "Matador",
+          "Gislaved", "Falken", "Laufenn"]
+LINES = ["Pilot Sport", "Primacy", "X-Ice North", "CrossClimate", "Winter", "Ice Zero", "Scorpion", "Cinturato",
+         "Hakkapeliitta", "Nordman", "EfficientGrip", "UltraGrip", "BluEarth", "Geolandar", "Blizzak", "Turanza",
+         "Ventus", "Winter i*cept", "Snow Cross", "Eco"]
+WIDTHS = [155, 165, 175, 185, 195, 205, 215, 225, 235, 245, 255, 265, 275, 285]
+PROFILES = [35, 40, 45, 50, 55, 60, 65, 70]
+RIMS = [13, 14, 15, 16, 17, 18, 19, 20]
+SUFFIXES = ["", "XL", "RunFlat", "шип", "91T", "94V", "SUV"]
+
+
+def generate_catalog(count, rng):
+    names = set()
+    while len(names) < count:
+        names.add(f"{rng.choice(BRANDS)} {rng.choice(LINES)} {rng.randint(2, 9)} "
+                  f"{rng.choice(WIDTHS)}/{rng.choice(PROFILES)}R{rng.choice(RIMS)} {rng.choice(SUFFIXES)}".strip())
+    return [{"id": idx, "name": name} for idx, name in enumerate(sorted(names))]
+
+
+def perturb(name, rng):
+    """Our feed spelling of a listing name: as is, with a typo or with an extra word"""
+    roll = rng.random()
+    if roll < 0.2:
+        words = name.split()
+        position = rng.randrange(len(words[0]) - 1)
+        words[0] = words[0][:position] + words[0][position + 1:]
+        return " ".join(words)
+    if roll < 0.4:
+        return f"Шина {name} летняя"
+    return name
+
+
+def main():
+    listings = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(1)
+
+    catalog = generate_catalog(listings, rng)
+    index = ListingIndex()
+    started = time.perf_counter()
+    index.update(catalog)
+    build_seconds = time.perf_counter() - started
+
+    sample = [rng.choice(catalog) for _ in range(queries)]
+    names = [perturb(record["name"], rng) for record in sample]
+    timings = []
+    hits = 0
+    for record, name in zip(sample, names):
+        started = time.perf_counter()
+        found = index.search(name, k=1)
+        timings.append(time.perf_counter() - started)
+        hits += bool(found) and found[0]["listing_id"] == str(record["id"])
+
+    timings.sort()
+    print(json.dumps({
+        "listings": len(index),
+        "queries": queries,
+        "build_seconds": round(build_seconds, 3),
+        "search_mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+        "search_p50_ms": round(timings[len(timings) // 2] * 1000, 3),
+        "search_p95_ms": round(timings[int(len(timings) * 0.95)] * 1000, 3),
+        "top1_accuracy": round(hits / queries, 4)
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
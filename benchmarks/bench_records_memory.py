@@ -0,0 +1,104 @@
+"""
+Memory benchmark: bytes per scanned item for the legacy nested-dict representation
+versus the slotted records from records.py
+
+Usage: python benchmarks/bench_records_memory.py [items]
+"""
+import os
+import sys
+import json
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import SellerPrice, MarketResult, ScanItem
+
+SELLERS = ["AIKOS", "Шинный центр", "Vianor", "Колесо", "ШинМаркет", "Шинный двор", "Эйкос", "Express Шины"]
+
+
+def _sample(idx, rng):
+    """Raw values of one item, shared by both representations"""
+    price = rng.randrange(20000, 400000, 100)
+    sellers = rng.sample(SELLERS, rng.randint(3, 5))
+    details = sorted(((s, rng.randrange(20000, 400000, 100)) for s in sellers), key=lambda d: d[1])
+    model = f"Michelin Pilot Sport 4 205/55R16 91Y #{idx}"
+    return price, sellers, details, model
+
+
+def build_dicts(count, seed=1):
+    """Items as process_xml_and_scan built them before: strings for numbers, nested dicts"""
+    rng = random.Random(seed)
+    items = []
+    for idx in range(count):
+        price, sellers, details, model = _sample(idx, rng)
+        items.append({
+            "sku": f"SKU-{idx}",
+            "model": model,
+            "our_price": str(price),
+            "stock": str(rng.randint(0, 50)),
+            "kaspi_results": [{
+                "kaspi_name": model,
+                "kaspi_price": str(details[0][1]),
+                "sellers": [d[0] for d in details],
+                "price_details": [
+                    {"seller": s, "price": p, "diff_percent": round((p - price) / price * 100, 2)}
+                    for s, p in details
+                ],
+                "kaspi_url": f"https://kaspi.kz/shop/search/?text={model}",
+                "price_difference_percent": round((details[0][1] - price) / price * 100, 2)
+            }]
+        })
+    return items
+
+
+def build_records(count, seed=1):
+    """Same items as ScanItem / MarketResult / SellerPrice records"""
+    rng = random.Random(seed)
+    items = []
+    for idx in range(count):
+        price, sellers, details, model = _sample(idx, rng)
+        items.append(ScanItem(
+            sku=f"SKU-{idx}",
+            model=model,
+            our_price=float(price),
+            stock=rng.randint(0, 50),
+            kaspi_results=[MarketResult(
+                kaspi_name=model,
+                kaspi_price=float(details[0][1]),
+                sellers=[d[0] for d in details],
+                price_details=[
+                    SellerPrice(s, p, round((p - price) / price * 100, 2)) for s, p in details
+                ],
+                kaspi_url=f"https://kaspi.kz/shop/search/?text={model}",
+                price_difference_percent=round((details[0][1] - price) / price * 100, 2)
+            )]
+        ))
+    return items
+
+
+def measure(builder, count):
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    items = builder(count)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return items, current - baseline, peak - baseline
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    report = {"items": count}
+    for name, builder in (("dicts", build_dicts), ("records", build_records)):
+        items, retained, peak = measure(builder, count)
+        report[name] = {
+            "bytes_per_item": round(retained / count, 1),
+            "peak_bytes_per_item": round(peak / count, 1)
+        }
+        del items
+    report["ratio"] = round(report["records"]["bytes_per_item"] / report["dicts"]["bytes_per_item"], 3)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Repricing benchmark: load, compute and export recommended prices for a large comparison
+
+Fills a temporary SQLite database with synthetic products, then times loading
+the comparison, computing recommendations and building the price XML.
+
+Target: about 1 s to load and compute 100k SKUs. Not reached yet: on SQLite this
+measures about 2.3-2.6 s (fetch ~0.5 s, JSON decoding ~0.8 s, compute ~0.6 s),
+because every seller dict of price_details is decoded in Python. The plan is to
+store seller prices in their own table at scan time, so the cheapest eligible
+competitor becomes one indexed GROUP BY query (about 0.85 s for 100k SKUs on
+SQLite in a prototype) and compute works on plain columns.
+
+Usage: python benchmarks/bench_repricing.py [skus]
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, Comparison, Product, KaspiResult
+from repricing import RepricingRules, load_pricing_columns, compute_recommendations, build_price_xml
+
+SELLERS = ["AIKOS", "Шинный центр", "Vianor", "Колесо", "ШинМаркет", "Шинный двор", "Эйкос", "Express Шины"]
+
+
+def seed(count, rng):
+    comparison = Comparison(filename="bench.xml", products_count=count)
+    db.session.add(comparison)
+    db.session.flush()
+
+    products, results = [], []
+    for idx in range(count):
+        price = rng.randrange(20000, 400000, 100)
+        products.append({"id": idx + 1, "comparison_id": comparison.id, "sku": f"SKU-{idx}",
+                         "model": f"Tire model {idx}", "our_price": float(price), "stock": rng.randint(0, 20)})
+        details = [{"seller": s, "price": rng.randrange(20000, 400000, 100), "diff_percent": 0.0,
+                    "stock": rng.randint(0, 10)} for s in rng.sample(SELLERS, rng.randint(3, 5))]
+        results.append({"product_id": idx + 1, "kaspi_name": f"Tire model {idx}",
+                        "kaspi_price": float(min(d["price"] for d in details)),
+                        "price_details": json.dumps(details, ensure_ascii=False)})
+    db.session.execute(Product.__table__.insert(), products)
+    db.session.execute(KaspiResult.__table__.insert(), results)
+    db.session.commit()
+    return comparison.id
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            comparison_id = seed(count, random.Random(1))
+            costs = {f"SKU-{idx}": 15000.0 for idx in range(0, count, 2)}
+            rules = RepricingRules(undercut=100, min_margin_percent=10, min_seller_stock=2)
+
+            started = time.perf_counter()
+            columns = load_pricing_columns(comparison_id)
+            load_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            recommendations = compute_recommendations(*columns, rules=rules, costs=costs)
+            compute_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            xml = build_price_xml(recommendations)
+            export_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        "skus": count,
+        "load_seconds": round(load_seconds, 3),
+        "compute_seconds": round(compute_seconds, 3),
+        "reprice_seconds": round(load_seconds + compute_seconds, 3),
+        "export_xml_seconds": round(export_seconds, 3),
+        "xml_bytes": len(xml)
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Startup benchmark: import time and worker cold start of the web app
+
+Every run starts a fresh interpreter, the same way a gunicorn worker without
+preload does, and times importing main, creating the app, the first request
+(engine connects, lazy modules load) and a warm request after it.
+
+Usage: python benchmarks/bench_startup.py [runs]
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Код, выполняемый в отдельном процессе; печатает замеры одной строкой JSON
+CHILD = r"""
+import sys, json, time, io
+started = time.perf_counter()
+sys.path.insert(0, ROOT)
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+client = app.test_client()
+# Невалидный XML: загружает модули анализа, но не ходит на Kaspi
+first = client.post('/scan', data={'file': (io.BytesIO(b'bad'), 'f.xml')}, content_type='multipart/form-data')
+client.get('/api/comparisons')
+first_done = time.perf_counter()
+client.get('/api/comparisons')
+warm_done = time.perf_counter()
+print(json.dumps({
+    "import_main": imported - started,
+    "create_app": created - imported,
+    "first_request": first_done - created,
+    "warm_request": warm_done - first_done,
+    "modules": len(sys.modules),
+    "status": first.status_code
+}))
+"""
+
+
+def run_child(env):
+    output = subprocess.run(
+        [sys.executable, "-c", f"ROOT = {ROOT!r}\n" + CHILD],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                   LOG_LEVEL="WARNING", RETENTION_INTERVAL_HOURS="0")
+        subprocess.run([sys.executable, "-m", "flask", "--app", "main", "init-db"],
+                       cwd=ROOT, env=env, capture_output=True, check=True)
+
+        samples = []
+        for _ in range(runs):
+            samples.append(run_child(env))
+
+    result = {"runs": runs, "modules_loaded": samples[-1]["modules"]}
+    for key in ("import_main", "create_app", "first_request", "warm_request"):
+        values = [sample[key] for sample in samples]
+        result[f"{key}_ms"] = {
+            "median": round(statistics.median(values) * 1000, 1),
+            "max": round(max(values) * 1000, 1)
+        }
+    result["cold_start_ms"] = round(statistics.median(
+        sample["import_main"] + sample["create_app"] + sample["first_request"] for sample in samples
+    ) * 1000, 1)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+HTTP load test: replay a mix of uploads and dashboard reads against the app
+
+Without --url the app is created by the factory against a temporary SQLite
+database (or --database-url, e.g. a local PostgreSQL) and served by a threaded
+werkzeug server inside this process. With --url an already running server is
+tested, for example `gunicorn -c gunicorn.conf.py`.
+
+Generated feeds are uploaded to /scan and /scan-with-config, while
+/api/comparisons and /api/comparison/<id> read what was saved. The result is
+JSON with p50/p95/p99 latency, throughput and error rate per endpoint; pass a
+previous result with --compare to get the differences between versions.
+
+Usage: python benchmarks/loadtest.py [--duration 30] [--concurrency 8]
+           [--mix scan=1,scan-with-config=1,comparisons=4,comparison=4]
+           [--items 20] [--url http://host:port] [--output result.json] [--compare old.json]
+"""
+import os
+import sys
+import json
+import logging
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENDPOINTS = ("scan", "scan-with-config", "comparisons", "comparison")
+DEFAULT_MIX = "scan=1,scan-with-config=1,comparisons=4,comparison=4"
+
+BRANDS = ["Michelin", "Nokian", "Bridgestone", "Continental", "Pirelli", "Hankook", "Yokohama", "Kumho"]
+LINES = ["Pilot Sport 4", "Hakkapeliitta 10", "Blizzak Ice", "IceContact 3", "Scorpion Verde", "Ventus Prime 3"]
+SIZES = ["205/55R16", "215/60R17", "225/45R18", "195/65R15", "235/55R19"]
+
+# Сколько сравнений создается перед замером, чтобы чтению было что читать
+_SEED_UPLOADS = 3
+
+
+def parse_mix(value):
+    """Parse 'scan=1,comparisons=4' into a weight per endpoint"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {name!r}, expected one of {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("At least one endpoint needs a positive weight")
+    return mix
+
+
+def generate_feed(items, rng):
+    """XML feed with unique SKUs, so every upload is a new comparison"""
+    prefix = uuid.uuid4().hex[:8]
+    rows = []
+    for idx in range(items):
+        model = f"{rng.choice(BRANDS)} {rng.choice(LINES)} {rng.choice(SIZES)}"
+        rows.append(
+            f"<item><sku>{prefix}-{idx}</sku><model>{model}</model>"
+            f"<price>{rng.randrange(20000, 400000, 100)}</price><stock>{rng.randint(0, 20)}</stock></item>"
+        )
+    return f'<?xml version="1.0" encoding="UTF-8"?><products>{"".join(rows)}</products>'.encode('utf-8')
+
+
+def _multipart(field, filename, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: application/xml\r\n\r\n"
+    ).encode('utf-8') + content + f"\r\n--{boundary}--\r\n".encode('utf-8')
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class LoadClient:
+    """Issues requests of the mix and keeps ids of comparisons seen so far"""
+
+    def __init__(self, base_url, items, duplicate_ratio, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.items = items
+        self.duplicate_ratio = duplicate_ratio
+        self.timeout = timeout
+        self.comparison_ids = []
+        self.feeds = []
+        self._lock = threading.Lock()
+
+    def _request(self, path, data=None, content_type=None):
+        request = urllib.request.Request(self.base_url + path, data=data, method='POST' if data else 'GET')
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def upload(self, path, rng):
+        with self._lock:
+            feeds = list(self.feeds)
+        if feeds and rng.random() < self.duplicate_ratio:
+            # Повтор уже загруженного файла проверяет путь дедупликации
+            content = rng.choice(feeds)
+        else:
+            content = generate_feed(self.items, rng)
+        body, content_type = _multipart('file', 'loadtest.xml', content)
+        status, payload = self._request(path, body, content_type)
+        if status == 200:
+            items = json.loads(payload)
+            with self._lock:
+                self.feeds.append(content)
+                if items and items[0].get('comparison_id') and items[0]['comparison_id'] not in self.comparison_ids:
+                    self.comparison_ids.append(items[0]['comparison_id'])
+        return status
+
+    def call(self, endpoint, rng):
+        if endpoint == "scan":
+            return self.upload('/scan', rng)
+        if endpoint == "scan-with-config":
+            return self.upload('/scan-with-config', rng)
+        if endpoint == "comparisons":
+            return self._request('/api/comparisons')[0]
+        with self._lock:
+            comparison_id = rng.choice(self.comparison_ids) if self.comparison_ids else 1
+        return self._request(f'/api/comparison/{comparison_id}')[0]
+
+
+def percentile(sorted_values, percent):
+    """Percentile with linear interpolation between closest ranks"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples, elapsed):
+    """Latency percentiles, throughput and error rate of (latency, status) samples"""
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, status in samples if status is None or status >= 400)
+    statuses = {}
+    for _, status in samples:
+        key = str(status) if status is not None else "error"
+        statuses[key] = statuses.get(key, 0) + 1
+
+    def _ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": _ms(percentile(latencies, 50)),
+            "p95": _ms(percentile(latencies, 95)),
+            "p99": _ms(percentile(latencies, 99)),
+            "mean": _ms(sum(latencies) / len(latencies)) if latencies else None,
+            "max": _ms(latencies[-1]) if latencies else None
+        },
+        "status_codes": statuses
+    }
+
+
+def compare_results(current, baseline):
+    """Relative change of the main metrics against a previous run, per endpoint"""
+    def _change(new, old):
+        if new is None or old is None:
+            return None
+        if old == 0:
+            return 0.0 if new == 0 else None
+        return round((new - old) * 100 / old, 1)
+
+    comparison = {}
+    for name, stats in current["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(name)
+        if not old:
+            continue
+        comparison[name] = {
+            f"{key}_change_percent": _change(stats["latency_ms"][key], old["latency_ms"][key])
+            for key in ("p50", "p95", "p99")
+        }
+        comparison[name]["throughput_change_percent"] = _change(stats["throughput_rps"], old["throughput_rps"])
+        comparison[name]["error_rate_diff"] = round(stats["error_rate"] - old["error_rate"], 4)
+    return comparison
+
+
+def run_load(client, mix, duration, concurrency, seed):
+    """Send requests from `concurrency` threads for `duration` seconds"""
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    deadline = time.perf_counter() + duration
+
+    def _worker(index):
+        rng = random.Random(seed + index)
+        local = {name: [] for name in names}
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = client.call(endpoint, rng)
+            except Exception:
+                status = None
+            local[endpoint].append((time.perf_counter() - started, status))
+        return local
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for local in pool.map(_worker, range(concurrency)):
+            for name, values in local.items():
+                samples[name].extend(values)
+    return samples, time.perf_counter() - started
+
+
+def start_local_server(database_url, max_items):
+    """Create the app with the factory and serve it from a background thread"""
+    from alembic import command
+    from alembic.config import Config
+    from werkzeug.serving import make_server
+    from main import create_app
+
+    options = {"pool_recycle": 300, "pool_pre_ping": True}
+    if database_url.startswith("sqlite"):
+        # Параллельные загрузки в SQLite ждут блокировку записи вместо ошибки "database is locked"
+        options["connect_args"] = {"timeout": 30}
+    app = create_app(config={
+        "SQLALCHEMY_DATABASE_URI": database_url,
+        "SQLALCHEMY_ENGINE_OPTIONS": options,
+        "MAX_ITEMS_TO_PROCESS": max_items
+    }, start_scheduler=False)
+    with app.app_context():
+        # Та же схема и индексы, что в продакшене
+        command.upgrade(Config(os.path.join(ROOT, 'alembic.ini')), 'head')
+
+    # werkzeug сам выставляет своему логгеру INFO и пишет строку на каждый запрос
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Kaspi price comparison app")
+    parser.add_argument("--url", help="Test a running server instead of starting a local one")
+    parser.add_argument("--database-url", help="Database for the local server (default: temporary SQLite)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel clients")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Endpoint weights ({DEFAULT_MIX})")
+    parser.add_argument("--items", type=int, default=20, help="Items per generated feed")
+    parser.add_argument("--max-items", type=int, default=50, help="MAX_ITEMS_TO_PROCESS of the local server")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1, help="Share of uploads repeating an earlier feed")
+    parser.add_argument("--timeout", type=float, default=120, help="Request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Also write the result to this file")
+    parser.add_argument("--compare", help="Previous result to compare with")
+    args = parser.parse_args()
+
+    # Лог каждого запроса искажает замер и засоряет вывод
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    server = None
+    with tempfile.TemporaryDirectory() as tmp:
+        base_url = args.url
+        database_url = None
+        if not base_url:
+            database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'loadtest.db')}"
+            server, base_url = start_local_server(database_url, args.max_items)
+
+        try:
+            client = LoadClient(base_url, args.items, args.duplicate_ratio, args.timeout)
+            seed_rng = random.Random(args.seed)
+            for _ in range(_SEED_UPLOADS):
+                client.upload('/scan', seed_rng)
+
+            samples, elapsed = run_load(client, args.mix, args.duration, args.concurrency, args.seed)
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    all_samples = [sample for values in samples.values() for sample in values]
+    result = {
+        "config": {
+            "target": args.url or "local",
+            "database": "external" if args.url else ("sqlite-temp" if not args.database_url else database_url.split(':', 1)[0]),
+            "duration_seconds": args.duration,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "items_per_feed": args.items,
+            "duplicate_ratio": args.duplicate_ratio
+        },
+        "elapsed_seconds": round(elapsed, 2),
+        "total": summarize(all_samples, elapsed),
+        "endpoints": {name: summarize(values, elapsed) for name, values in samples.items()}
+    }
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            result["comparison"] = compare_results(result, json.load(f))
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
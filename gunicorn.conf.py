@@ -0,0 +1,38 @@
+import os
+
+# Production-запуск: gunicorn -c gunicorn.conf.py
+# Приложение создается фабрикой один раз в мастер-процессе (preload) и наследуется воркерами,
+# поэтому импорт Flask, SQLAlchemy и моделей не повторяется в каждом воркере.
+
+wsgi_app = "main:create_app(start_scheduler=False)"
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Количество воркеров (WEB_CONCURRENCY задают Railway/Heroku) и потоков в каждом
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+
+# Сканирование ходит на Kaspi и может идти дольше стандартных 30 секунд
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info").lower()
+
+
+def post_fork(server, worker):
+    """Drop pooled connections inherited from the master and start per-worker background jobs"""
+    from models import db
+    from retention import start_retention_scheduler
+
+    app = server.app.wsgi()
+    with app.app_context():
+        # Соединения из пула мастера нельзя использовать в дочернем процессе:
+        # close=False забывает их, не закрывая сокеты, которые еще принадлежат мастеру
+        db.engine.dispose(close=False)
+
+    # Потоки мастера не переживают fork, поэтому планировщик запускается в каждом воркере;
+    # одновременную свертку исключает advisory lock в PostgreSQL
+    start_retention_scheduler(app)
@@ -1,47 +1,155 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, current_app, render_template, request, jsonify, redirect, url_for
+from flask.cli import with_appcontext
 import os
 import logging
 import xml.etree.ElementTree as ET
 from werkzeug.utils import secure_filename
-from parser import process_xml_and_scan
-from models import db, Comparison, Product, KaspiResult
+from models import db, Comparison, Product, database_now
 import json
+import click
+import hashlib
+from datetime import timedelta
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from dotenv import load_dotenv
 
-# Load environment variables from .env file if it exists
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, 
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "kaspi-price-comparison-tool")
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit upload size to 16MB
+# Модули анализа, переоценки, свертки и профилирования импортируются по месту использования:
+# импорт main и запуск CLI-команд не тянут за собой парсер, сопоставление каталога и т.п.
+
 
-# Configure database
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL")
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+def configure_logging():
+    """Configure root logging unless the server or test runner already did"""
+    # basicConfig ничего не делает, если у корневого логгера уже есть обработчики
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-# Initialize database
-db.init_app(app)
 
-# Create database tables if they don't exist
-with app.app_context():
-    db.create_all()
+def create_app(config=None, start_scheduler=True):
+    """
+    Create and configure the Flask application
+    
+    Creating the app does not connect to the database: the engine opens connections
+    on first use, and the schema is created by migrations with `flask --app main init-db`.
+    
+    Args:
+        config: Optional mapping of config values overriding the environment
+        start_scheduler: Start the retention scheduler if RETENTION_INTERVAL_HOURS is set.
+            gunicorn.conf.py passes False and starts it in each worker after fork.
+    
+    Returns:
+        Flask application
+    """
+    # Load environment variables from .env file if it exists
+    load_dotenv()
+    configure_logging()
+    
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "kaspi-price-comparison-tool")
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit upload size to 16MB
+    
+    # Configure database
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL")
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+    
+    # Повторная загрузка того же файла в течение этого времени возвращает уже сохраненное сравнение
+    app.config['DEDUP_WINDOW_SECONDS'] = int(os.environ.get("DEDUP_WINDOW_SECONDS", 3600))
+    
+    # Максимальное количество обрабатываемых товаров для /scan-with-config
+    app.config['MAX_ITEMS_TO_PROCESS'] = int(os.environ.get("MAX_ITEMS_TO_PROCESS", 50))
+    
+    if config:
+        app.config.update(config)
+    
+    # Initialize database (engine создается лениво, соединений здесь нет)
+    db.init_app(app)
+    
+    _register_routes(app)
+    for command in (init_db_command, explain_hot_paths_command, compact_history_command,
+                    backfill_stats_command, reprice_command):
+        app.cli.add_command(command)
+    
+    # Запускаем периодическую свертку старых сравнений (если задан RETENTION_INTERVAL_HOURS)
+    if start_scheduler and float(os.environ.get("RETENTION_INTERVAL_HOURS", 0)) > 0:
+        from retention import start_retention_scheduler
+        start_retention_scheduler(app)
+    
+    return app
+
+# Ключ advisory lock в PostgreSQL, чтобы миграции применял только один процесс
+_MIGRATION_LOCK_KEY = 26036
+
+@click.command('init-db')
+@click.option('--revision', default='head', help='Target migration revision')
+@with_appcontext
+def init_db_command(revision):
+    """Create or upgrade the database schema by applying migrations"""
+    from alembic import command
+    from alembic.config import Config
+    
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alembic.ini'))
+    if db.engine.dialect.name != 'postgresql':
+        command.upgrade(config, revision)
+    else:
+        # Несколько экземпляров могут стартовать одновременно: миграции применяет первый,
+        # остальные ждут блокировку и видят уже обновленную схему
+        with db.engine.connect() as lock_conn:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+            lock_conn.commit()
+            try:
+                command.upgrade(config, revision)
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+                lock_conn.commit()
+    click.echo(f"Database upgraded to {revision}")
+
+@click.command('explain-hot-paths')
+@click.option('--verbose', is_flag=True, help='Print full query plans')
+@with_appcontext
+def explain_hot_paths_command(verbose):
+    """Check with EXPLAIN that the main endpoint queries use indexes; exits with 1 otherwise"""
+    from query_plans import explain_hot_paths
+    
+    reports = explain_hot_paths()
+    for report in reports:
+        status = "ok" if not report["sequential_scans"] else "SEQ SCAN on " + ", ".join(report["sequential_scans"])
+        click.echo(f"{report['name']}: {status}")
+        if verbose:
+            for line in report["plan"]:
+                click.echo(f"    {line}")
+    if any(report["sequential_scans"] for report in reports):
+        raise SystemExit(1)
+
+@click.command('compact-history')
+@click.option('--days', type=int, default=None, help='Compact comparisons older than this many days')
+@click.option('--batch-size', type=int, default=None, help='Products deleted per transaction')
+@click.option('--dry-run', is_flag=True, help='Only report what would be compacted')
+@with_appcontext
+def compact_history_command(days, batch_size, dry_run):
+    """Roll up old comparisons into per-SKU summaries and delete detailed rows"""
+    from retention import compact_old_comparisons
+    report = compact_old_comparisons(days=days, batch_size=batch_size, dry_run=dry_run)
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+
+@click.command('backfill-stats')
+@click.option('--force', is_flag=True, help='Recompute statistics for all comparisons')
+@with_appcontext
+def backfill_stats_command(force):
+    """Compute aggregate statistics for comparisons that do not have them yet"""
+    from stats import backfill_comparison_stats
+    count = backfill_comparison_stats(force=force)
+    click.echo(f"Computed statistics for {count} comparisons")
 
-@app.route('/')
 def index():
     """Serve the upload page"""
     return render_template('index.html')
 
-@app.route('/example.xml')
 def example_xml():
     """Generate example XML file with sample products"""
     xml_content = """<?xml version="1.0" encoding="UTF-8"?>
@@ -65,7 +173,7 @@ def example_xml():
     <stock>15</stock>
   </item>
 </products>"""
-    response = app.response_class(
+    response = current_app.response_class(
         response=xml_content,
         status=200,
         mimetype='application/xml'
@@ -73,9 +181,42 @@ def example_xml():
     response.headers["Content-Disposition"] = "attachment; filename=example.xml"
     return response
 
-@app.route('/scan', methods=['POST'])
+def compute_upload_key(content, max_items):
+    """Hash uploaded content together with scan parameters"""
+    digest = hashlib.sha256(content)
+    digest.update(f"|max_items={max_items}".encode('utf-8'))
+    return digest.hexdigest()
+
+def find_recent_comparison(upload_key):
+    """
+    Find a comparison saved for the same upload within DEDUP_WINDOW_SECONDS
+    
+    Returns:
+        Comparison instance or None
+    """
+    window = current_app.config['DEDUP_WINDOW_SECONDS']
+    if window <= 0:
+        return None
+    # Окно отсчитываем от часов базы, которыми заполняется created_at
+    cutoff = database_now() - timedelta(seconds=window)
+    return (Comparison.query
+            .filter(Comparison.upload_key == upload_key, Comparison.created_at >= cutoff)
+            .first())
+
+def load_scan_items(comparison):
+    """Rebuild scan result records from a saved comparison"""
+    products = (Product.query
+                .filter_by(comparison_id=comparison.id)
+                .options(selectinload(Product.kaspi_results))
+                .order_by(Product.id)
+                .all())
+    from records import ScanItem
+    return [ScanItem.from_product(product) for product in products]
+
 def upload_and_scan_file():
     """Process uploaded XML file and return comparison results"""
+    from pipeline import run_scan_pipeline
+    
     if 'file' not in request.files:
         logger.error("No file part in the request")
         return jsonify({"error": "No file part"}), 400
@@ -101,62 +242,32 @@ def upload_and_scan_file():
             logger.error(f"XML parse error: {str(e)}")
             return jsonify({"error": "Invalid XML format"}), 400
         
+        # Если тот же файл с теми же параметрами уже обработан недавно, возвращаем готовый результат
+        upload_key = compute_upload_key(content, 50)
+        existing = find_recent_comparison(upload_key)
+        if existing is not None:
+            logger.info(f"Duplicate upload, returning comparison #{existing.id}")
+            return jsonify([item.to_dict(comparison_id=existing.id) for item in load_scan_items(existing)])
+        
         # Process the XML content and compare with Kaspi
         # Ограничиваем обработку 50 товарами для предотвращения перегрузки памяти и сбоев сервера
-        results = process_xml_and_scan(content, max_items=50)
-        logger.info(f"Processing completed. Found {len(results)} products. Limited to max 50 items.")
-        
-        # Сохраняем результаты в базу данных
-        comparison = Comparison(
-            filename=secure_filename(file.filename),
-            products_count=len(results)
-        )
-        db.session.add(comparison)
-        
-        # Добавляем продукты
-        for product_data in results:
-            product = Product(
-                comparison=comparison,
-                sku=product_data.get('sku', ''),
-                model=product_data.get('model', ''),
-                our_price=float(product_data.get('our_price', 0)),
-                stock=int(product_data.get('stock', 0))
+        # Анализ и запись в базу идут параллельно, все сохраняется одной транзакцией
+        try:
+            comparison, results = run_scan_pipeline(
+                content, 50, secure_filename(file.filename), upload_key=upload_key
             )
-            db.session.add(product)
-            
-            # Добавляем результаты Kaspi для каждого продукта
-            for kaspi_result in product_data.get('kaspi_results', []):
-                kaspi_price = kaspi_result.get('kaspi_price', '0')
-                
-                # Преобразуем строковую цену в число
-                try:
-                    kaspi_price_float = float(kaspi_price.replace(',', '.').strip())
-                except (ValueError, TypeError):
-                    logger.warning(f"Invalid price format: {kaspi_price}")
-                    kaspi_price_float = 0
-                
-                result = KaspiResult(
-                    product=product,
-                    kaspi_name=kaspi_result.get('kaspi_name', ''),
-                    kaspi_price=kaspi_price_float,
-                    price_difference_percent=kaspi_result.get('price_difference_percent')
-                )
-                
-                # Сохраняем список продавцов как JSON
-                sellers = kaspi_result.get('sellers', [])
-                result.set_sellers(sellers)
-                
-                db.session.add(result)
-        
-        # Коммитим изменения в базу данных
-        db.session.commit()
-        logger.info(f"Saved comparison #{comparison.id} to database with {len(results)} products")
+            logger.info(f"Processing completed. Found {len(results)} products. Limited to max 50 items.")
+        except IntegrityError:
+            # Параллельная загрузка того же файла успела сохраниться первой
+            db.session.rollback()
+            comparison = Comparison.query.filter_by(upload_key=upload_key).first()
+            if comparison is None:
+                raise
+            logger.info(f"Concurrent duplicate upload, returning comparison #{comparison.id}")
+            return jsonify([item.to_dict(comparison_id=comparison.id) for item in load_scan_items(comparison)])
         
         # Добавляем id сравнения в результаты для использования в интерфейсе
-        for result in results:
-            result['comparison_id'] = comparison.id
-            
-        return jsonify(results)
+        return jsonify([item.to_dict(comparison_id=comparison.id) for item in results])
     
     except Exception as e:
         # В случае ошибки делаем rollback
@@ -164,24 +275,20 @@ def upload_and_scan_file():
         logger.error(f"Error processing file: {str(e)}")
         return jsonify({"error": f"Error processing file: {str(e)}"}), 500
 
-@app.route('/results')
 def results():
     """Serve the results page"""
     return render_template('results.html')
 
-@app.route('/history')
 def history():
     """Serve the history page with all saved comparisons"""
     comparisons = Comparison.query.order_by(Comparison.created_at.desc()).all()
     return render_template('history.html', comparisons=comparisons)
 
-@app.route('/api/comparisons')
 def get_comparisons():
     """Get list of all comparisons"""
     comparisons = Comparison.query.order_by(Comparison.created_at.desc()).all()
     return jsonify([c.to_dict(include_products=False) for c in comparisons])
 
-@app.route('/api/comparison/<int:comparison_id>')
 def get_comparison(comparison_id):
     """Get details of a specific comparison"""
     comparison = Comparison.query.get_or_404(comparison_id)
@@ -200,24 +307,93 @@ def get_comparison(comparison_id):
     
     return jsonify(result)
 
-# Add error handlers
-@app.errorhandler(413)
+def reprice(comparison_id):
+    """
+    Compute recommended prices for every SKU of a comparison
+    
+    JSON body: rule fields (undercut, min_margin_percent, round_to, min_seller_stock,
+    our_seller) and optional "costs" mapping sku -> cost. With ?format=xml the result
+    is returned as a Kaspi price list.
+    """
+    from repricing import (RepricingRules, parse_costs, reprice_comparison, summarize_recommendations,
+                           build_price_xml)
+    
+    Comparison.query.get_or_404(comparison_id)
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        logger.error("Invalid repricing rules: body is not a JSON object")
+        return jsonify({"error": "Invalid repricing rules: expected a JSON object"}), 400
+    
+    try:
+        rules = RepricingRules.from_dict(data)
+        costs = parse_costs(data.get('costs') or {})
+    except (TypeError, ValueError) as e:
+        logger.error(f"Invalid repricing rules: {str(e)}")
+        return jsonify({"error": f"Invalid repricing rules: {str(e)}"}), 400
+    
+    recommendations = reprice_comparison(comparison_id, rules, costs)
+    
+    if request.args.get('format') == 'xml':
+        response = current_app.response_class(
+            response=build_price_xml(recommendations),
+            status=200,
+            mimetype='application/xml'
+        )
+        response.headers["Content-Disposition"] = f"attachment; filename=prices-{comparison_id}.xml"
+        return response
+    
+    return jsonify({
+        "comparison_id": comparison_id,
+        "rules": rules.to_dict(),
+        "summary": summarize_recommendations(recommendations),
+        "items": [rec.to_dict() for rec in recommendations]
+    })
+
+@click.command('reprice')
+@click.argument('comparison_id', type=int)
+@click.option('--undercut', type=float, default=100, help='Beat the cheapest competitor by this many tenge')
+@click.option('--min-margin', type=float, default=0, help='Minimum margin over cost, percent')
+@click.option('--round-to', type=int, default=100, help='Round prices to this step')
+@click.option('--min-seller-stock', type=int, default=None, help='Ignore competitors with lower known stock')
+@click.option('--costs', 'costs_path', type=click.Path(exists=True), default=None, help='JSON file with sku -> cost')
+@click.option('--output', '-o', type=click.Path(), default=None, help='Write Kaspi price XML to this file')
+@with_appcontext
+def reprice_command(comparison_id, undercut, min_margin, round_to, min_seller_stock, costs_path, output):
+    """Compute recommended prices for a comparison"""
+    from repricing import (RepricingRules, parse_costs, reprice_comparison, summarize_recommendations,
+                           build_price_xml)
+    
+    try:
+        rules = RepricingRules(undercut=undercut, min_margin_percent=min_margin, round_to=round_to,
+                               min_seller_stock=min_seller_stock)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    costs = None
+    if costs_path:
+        with open(costs_path, 'r', encoding='utf-8') as f:
+            raw_costs = json.load(f)
+        try:
+            costs = parse_costs(raw_costs)
+        except (TypeError, ValueError) as e:
+            raise click.BadParameter(str(e), param_hint='--costs')
+    
+    recommendations = reprice_comparison(comparison_id, rules, costs)
+    if output:
+        with open(output, 'wb') as f:
+            f.write(build_price_xml(recommendations))
+    click.echo(json.dumps(summarize_recommendations(recommendations), ensure_ascii=False, indent=2))
+
+# Error handlers
 def request_entity_too_large(error):
     return jsonify({"error": "File too large. Maximum size is 16MB"}), 413
 
-@app.errorhandler(500)
 def internal_server_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
-# Получаем значения из переменных окружения
-
-# Получаем максимальное количество обрабатываемых товаров из переменных окружения
-MAX_ITEMS_TO_PROCESS = int(os.environ.get("MAX_ITEMS_TO_PROCESS", 50))
-
-# Создаем новый маршрут с другим именем функции
-@app.route('/scan-with-config', methods=['POST'])
 def scan_with_config():
     """Process uploaded XML file and return comparison results using environment config"""
+    from pipeline import run_scan_pipeline
+    
     if 'file' not in request.files:
         logger.error("No file part in the request")
         return jsonify({"error": "No file part"}), 400
@@ -243,67 +419,33 @@ def scan_with_config():
             logger.error(f"XML parse error: {str(e)}")
             return jsonify({"error": "Invalid XML format"}), 400
         
+        # Если тот же файл с теми же параметрами уже обработан недавно, возвращаем готовый результат
+        max_items = current_app.config['MAX_ITEMS_TO_PROCESS']
+        upload_key = compute_upload_key(content, max_items)
+        existing = find_recent_comparison(upload_key)
+        if existing is not None:
+            logger.info(f"Duplicate upload, returning comparison #{existing.id}")
+            return jsonify([item.to_dict(comparison_id=existing.id) for item in load_scan_items(existing)])
+        
         # Process the XML content and compare with Kaspi
         # Используем переменную окружения для ограничения количества товаров
-        results = process_xml_and_scan(content, max_items=MAX_ITEMS_TO_PROCESS)
-        logger.info(f"Processing completed. Found {len(results)} products. Limited to max {MAX_ITEMS_TO_PROCESS} items.")
-        
-        # Сохраняем результаты в базу данных
-        comparison = Comparison(
-            filename=secure_filename(file.filename),
-            products_count=len(results)
-        )
-        db.session.add(comparison)
-        
-        # Добавляем продукты
-        for product_data in results:
-            product = Product(
-                comparison=comparison,
-                sku=product_data.get('sku', ''),
-                model=product_data.get('model', ''),
-                our_price=float(product_data.get('our_price', 0)),
-                stock=int(product_data.get('stock', 0))
+        # Анализ и запись в базу идут параллельно, все сохраняется одной транзакцией
+        try:
+            comparison, results = run_scan_pipeline(
+                content, max_items, secure_filename(file.filename), upload_key=upload_key
             )
-            db.session.add(product)
-            
-            # Добавляем результаты Kaspi для каждого продукта
-            for kaspi_result in product_data.get('kaspi_results', []):
-                kaspi_price = kaspi_result.get('kaspi_price', '0')
-                
-                # Преобразуем строковую цену в число
-                try:
-                    kaspi_price_float = float(kaspi_price.replace(',', '.').strip())
-                except (ValueError, TypeError):
-                    logger.warning(f"Invalid price format: {kaspi_price}")
-                    kaspi_price_float = 0
-                
-                result = KaspiResult(
-                    product=product,
-                    kaspi_name=kaspi_result.get('kaspi_name', ''),
-                    kaspi_price=kaspi_price_float,
-                    price_difference_percent=kaspi_result.get('price_difference_percent', 0)
-                )
-                
-                # Сохраняем список продавцов как JSON
-                sellers = kaspi_result.get('sellers', [])
-                result.set_sellers(sellers)
-                
-                # Сохраняем URL для проверки на Kaspi
-                if 'kaspi_url' in kaspi_result:
-                    # Добавление URL в данные
-                    result.kaspi_url = kaspi_result.get('kaspi_url', '')
-                
-                db.session.add(result)
-        
-        # Коммитим изменения в базу данных
-        db.session.commit()
-        logger.info(f"Saved comparison #{comparison.id} to database with {len(results)} products")
+            logger.info(f"Processing completed. Found {len(results)} products. Limited to max {max_items} items.")
+        except IntegrityError:
+            # Параллельная загрузка того же файла успела сохраниться первой
+            db.session.rollback()
+            comparison = Comparison.query.filter_by(upload_key=upload_key).first()
+            if comparison is None:
+                raise
+            logger.info(f"Concurrent duplicate upload, returning comparison #{comparison.id}")
+            return jsonify([item.to_dict(comparison_id=comparison.id) for item in load_scan_items(comparison)])
         
         # Добавляем id сравнения в результаты для использования в интерфейсе
-        for result in results:
-            result['comparison_id'] = comparison.id
-            
-        return jsonify(results)
+        return jsonify([item.to_dict(comparison_id=comparison.id) for item in results])
     
     except Exception as e:
         # В случае ошибки делаем rollback
@@ -311,7 +453,28 @@ def scan_with_config():
         logger.error(f"Error processing file: {str(e)}")
         return jsonify({"error": f"Error processing file: {str(e)}"}), 500
 
+def _register_routes(app):
+    """Register views and error handlers on the app"""
+    from profiling import profiled, profiles_view
+    
+    app.add_url_rule('/', 'index', index)
+    app.add_url_rule('/example.xml', 'example_xml', example_xml)
+    app.add_url_rule('/scan', 'upload_and_scan_file', profiled(upload_and_scan_file), methods=['POST'])
+    # Маршрут с лимитом товаров из MAX_ITEMS_TO_PROCESS
+    app.add_url_rule('/scan-with-config', 'scan_with_config', profiled(scan_with_config), methods=['POST'])
+    app.add_url_rule('/results', 'results', results)
+    app.add_url_rule('/history', 'history', history)
+    app.add_url_rule('/api/comparisons', 'get_comparisons', get_comparisons)
+    app.add_url_rule('/api/comparison/<int:comparison_id>', 'get_comparison', profiled(get_comparison))
+    app.add_url_rule('/api/comparison/<int:comparison_id>/reprice', 'reprice', reprice, methods=['POST'])
+    # Список последних профилей запросов (доступен только с PROFILE_TOKEN)
+    app.add_url_rule('/api/profiles', 'profiles', profiles_view)
+    
+    app.register_error_handler(413, request_entity_too_large)
+    app.register_error_handler(500, internal_server_error)
+
 if __name__ == '__main__':
+    app = create_app()
     port = int(os.environ.get("PORT", 5000))
     debug_mode = os.environ.get("DEBUG", "False").lower() == "true"
     app.run(host='0.0.0.0', port=port, debug=debug_mode)
\ No newline at end of file
@@ -0,0 +1,295 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import heapq
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Путь к локальной выгрузке каталога Kaspi (JSON-массив или JSON Lines с полями id, name, url)
+KASPI_CATALOG_PATH = os.environ.get("KASPI_CATALOG_PATH", "")
+
+# Как часто проверять, не обновился ли файл каталога (в секундах)
+CATALOG_REFRESH_SECONDS = int(os.environ.get("CATALOG_REFRESH_SECONDS", 60))
+
+# Минимальная оценка, при которой листинг считается совпадением
+MATCH_MIN_SCORE = float(os.environ.get("MATCH_MIN_SCORE", 0.35))
+
+# Веса признаков: размер шины и целые токены важнее отдельных триграмм
+_SIZE_WEIGHT = 6
+_TOKEN_WEIGHT = 3
+_TRIGRAM_WEIGHT = 1
+
+# Максимальный размер начального множества кандидатов из самых редких признаков
+# (все кандидаты оцениваются точно, так что он ограничивает время поиска)
+_SEED_SIZE = 512
+
+_TOKEN_RE = re.compile(r'\d+(?:[.,]\d+)?|[a-zа-я]+\d*')
+_SIZE_RE = re.compile(r'(\d{3})\s*/\s*(\d{2})\s*z?r\s*(\d{2})')
+
+
+def tokenize(name):
+    """Split a product name into lowercase word and number tokens"""
+    return _TOKEN_RE.findall((name or '').lower().replace('ё', 'е'))
+
+
+def _trigrams(token):
+    padded = f' {token} '
+    return ['g:' + padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def _size_features(name):
+    return [f's:{width}/{profile}r{rim}' for width, profile, rim in _SIZE_RE.findall((name or '').lower())]
+
+
+def extract_features(name):
+    """
+    Build weighted matching features for a name
+
+    Returns:
+        Dictionary feature -> weight: tire sizes like 205/55R16, whole tokens
+        and character trigrams of each token
+    """
+    features = dict.fromkeys(_size_features(name), _SIZE_WEIGHT)
+    for token in tokenize(name):
+        features['t:' + token] = _TOKEN_WEIGHT
+        for trigram in _trigrams(token):
+            features[trigram] = _TRIGRAM_WEIGHT
+    return features
+
+
+class ListingIndex:
+    """
+    In-memory inverted index over marketplace listing names
+
+    Postings map each token and trigram feature to the set of listing ids
+    containing it. Listings can be added, replaced and removed one by one,
+    so the index can be refreshed from a new catalog dump without a rebuild.
+    """
+
+    def __init__(self):
+        self._listings = {}  # listing_id -> {"name", "url"}
+        self._features = {}  # listing_id -> frozenset of features
+        self._weights = {}   # listing_id -> sum of feature weights
+        self._postings = defaultdict(set)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._listings)
+
+    def __contains__(self, listing_id):
+        return str(listing_id) in self._listings
+
+    def get(self, listing_id):
+        return self._listings.get(str(listing_id))
+
+    def add(self, listing_id, name, url=None):
+        """Add a listing or replace an existing one with the same id"""
+        listing_id = str(listing_id)
+        with self._lock:
+            if listing_id in self._listings:
+                if self._listings[listing_id]["name"] == name:
+                    self._listings[listing_id]["url"] = url
+                    return
+                self.remove(listing_id)
+
+            features = extract_features(name)
+            self._listings[listing_id] = {"name": name, "url": url}
+            self._features[listing_id] = frozenset(features)
+            self._weights[listing_id] = sum(features.values())
+            for feature in features:
+                self._postings[feature].add(listing_id)
+
+    def remove(self, listing_id):
+        """Remove a listing from the index, ignoring unknown ids"""
+        listing_id = str(listing_id)
+        with self._lock:
+            features = self._features.pop(listing_id, None)
+            if features is None:
+                return
+            del self._listings[listing_id]
+            del self._weights[listing_id]
+            for feature in features:
+                posting = self._postings.get(feature)
+                if posting is not None:
+                    posting.discard(listing_id)
+                    if not posting:
+                        del self._postings[feature]
+
+    def update(self, records, prune=False):
+        """
+        Apply catalog records incrementally
+
+        Args:
+            records: Iterable of dicts with "id", "name" and optional "url" / "deleted"
+            prune: Remove listings that are absent from `records` (full dump)
+
+        Returns:
+            Number of listings in the index after the update
+        """
+        seen = set()
+        with self._lock:
+            for record in records:
+                listing_id = record.get("id")
+                if listing_id is None:
+                    continue
+                listing_id = str(listing_id)
+                if record.get("deleted") or not record.get("name"):
+                    self.remove(listing_id)
+                    continue
+                self.add(listing_id, record["name"], record.get("url"))
+                seen.add(listing_id)
+
+            if prune:
+                for listing_id in [i for i in self._listings if i not in seen]:
+                    self.remove(listing_id)
+            return len(self._listings)
+
+    def _query_postings(self, query):
+        """
+        Collect (posting, weight) pairs for a query
+
+        A token present in the index absorbs the weight of its trigrams, so only
+        unknown tokens (typos, other spellings) are matched trigram by trigram.
+        """
+        postings = [(self._postings[f], _SIZE_WEIGHT) for f in _size_features(query) if f in self._postings]
+        for token in tokenize(query):
+            trigrams = _trigrams(token)
+            posting = self._postings.get('t:' + token)
+            if posting is not None:
+                postings.append((posting, _TOKEN_WEIGHT + _TRIGRAM_WEIGHT * len(trigrams)))
+                continue
+            postings.extend(
+                (self._postings[trigram], _TRIGRAM_WEIGHT) for trigram in trigrams if trigram in self._postings
+            )
+        return postings
+
+    def search(self, query, k=5):
+        """
+        Find the top-k listings for a product name
+
+        Candidates are the listings of the rarest query features; each of them is
+        scored with a weighted Dice coefficient over all shared features.
+
+        Returns:
+            List of dicts with listing_id, name, url and score (0..1), best first
+        """
+        query_weight = sum(extract_features(query).values())
+        if not query_weight:
+            return []
+
+        with self._lock:
+            postings = self._query_postings(query)
+            if not postings:
+                return []
+            postings.sort(key=lambda item: len(item[0]))
+
+            # Кандидаты - объединение самых редких списков в пределах _SEED_SIZE (но не меньше
+            # одного списка). Их не сужаем пересечениями и не обрезаем: каждый кандидат получает
+            # вес общих признаков по всем спискам запроса, поэтому опечатка или лишнее слово
+            # в нашем названии не отсекают верный листинг, а результат не зависит от порядка
+            # элементов в множествах.
+            candidates = set(postings[0][0])
+            position = 1
+            while position < len(postings) and len(candidates) + len(postings[position][0]) <= _SEED_SIZE:
+                candidates |= postings[position][0]
+                position += 1
+
+            shared = dict.fromkeys(candidates, 0)
+            for posting, weight in postings:
+                for listing_id in candidates & posting:
+                    shared[listing_id] += weight
+
+            weights = self._weights
+            scored = heapq.nlargest(k, (
+                (2 * shared_weight / (query_weight + weights[listing_id]), listing_id)
+                for listing_id, shared_weight in shared.items()
+            ))
+            return [
+                {
+                    "listing_id": listing_id,
+                    "name": self._listings[listing_id]["name"],
+                    "url": self._listings[listing_id]["url"],
+                    "score": round(min(score, 1.0), 4)
+                }
+                for score, listing_id in scored
+            ]
+
+
+def read_catalog_dump(path):
+    """Read listing records from a JSON array or JSON Lines catalog dump"""
+    with open(path, 'r', encoding='utf-8') as f:
+        head = f.read(1)
+        f.seek(0)
+        if head == '[':
+            return json.load(f)
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_listing_index(path):
+    """Build a ListingIndex from a catalog dump"""
+    index = ListingIndex()
+    index.update(read_catalog_dump(path))
+    return index
+
+
+_index = None
+_index_mtime = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_listing_index():
+    """
+    Return the process-wide listing index, or None if no catalog is configured
+
+    The catalog file is checked at most every CATALOG_REFRESH_SECONDS and
+    applied incrementally when it changes.
+    """
+    global _index, _index_mtime, _index_checked_at
+
+    if not KASPI_CATALOG_PATH:
+        return None
+
+    now = time.monotonic()
+    if _index is not None and now - _index_checked_at < CATALOG_REFRESH_SECONDS:
+        return _index
+
+    with _index_lock:
+        _index_checked_at = now
+        try:
+            mtime = os.path.getmtime(KASPI_CATALOG_PATH)
+        except OSError as e:
+            logger.warning(f"Catalog dump is not available: {str(e)}")
+            return _index
+
+        if mtime != _index_mtime:
+            try:
+                records = read_catalog_dump(KASPI_CATALOG_PATH)
+                if _index is None:
+                    _index = ListingIndex()
+                count = _index.update(records, prune=True)
+                _index_mtime = mtime
+                logger.info(f"Loaded catalog index with {count} listings from {KASPI_CATALOG_PATH}")
+            except (OSError, ValueError) as e:
+                logger.error(f"Error loading catalog dump: {str(e)}")
+        return _index
+
+
+def match_listing(model, k=5):
+    """
+    Find the best matching marketplace listing for our model name
+
+    Returns:
+        Tuple (best_match or None, candidates list)
+    """
+    index = get_listing_index()
+    if index is None:
+        return None, []
+    candidates = index.search(model, k=k)
+    if candidates and candidates[0]["score"] >= MATCH_MIN_SCORE:
+        return candidates[0], candidates
+    return None, candidates
@@ -0,0 +1,37 @@
+from logging.config import fileConfig
+
+from alembic import context
+from flask import current_app, has_app_context
+
+from models import db
+
+config = context.config
+
+# Из CLI приложения (flask --app main init-db) используется уже созданное приложение
+# и его логирование; при запуске alembic напрямую приложение создается фабрикой
+if has_app_context():
+    app = current_app._get_current_object()
+else:
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name, disable_existing_loggers=False)
+    from main import create_app
+    app = create_app(start_scheduler=False)
+
+target_metadata = db.metadata
+
+
+def run_migrations_online():
+    """Run migrations in a transaction on the application's engine"""
+    with app.app_context():
+        with db.engine.connect() as connection:
+            # render_as_batch: SQLite не умеет ALTER для ограничений, batch пересоздает таблицу
+            context.configure(connection=connection, target_metadata=target_metadata,
+                              compare_type=True, render_as_batch=True)
+            with context.begin_transaction():
+                context.run_migrations()
+
+
+if context.is_offline_mode():
+    # Миграции проверяют существующие таблицы и колонки, поэтому им нужно соединение с базой
+    raise RuntimeError("Offline (--sql) mode is not supported: migrations inspect the live database")
+run_migrations_online()
@@ -0,0 +1,60 @@
+"""Baseline: comparisons, products and kaspi_results
+
+Databases created earlier by db.create_all() already have these tables, so
+existing tables are left as they are and the revision is only recorded.
+
+Revision ID: 3f1c2a7d9b10
+Revises:
+Create Date: 2026-10-19 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'comparisons' not in tables:
+        op.create_table(
+            'comparisons',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('filename', sa.String(length=255), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('products_count', sa.Integer(), nullable=True)
+        )
+
+    if 'products' not in tables:
+        op.create_table(
+            'products',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('comparison_id', sa.Integer(), sa.ForeignKey('comparisons.id'), nullable=True),
+            sa.Column('sku', sa.String(length=100), nullable=True),
+            sa.Column('model', sa.String(length=255), nullable=True),
+            sa.Column('our_price', sa.Float(), nullable=True),
+            sa.Column('stock', sa.Integer(), nullable=True)
+        )
+
+    if 'kaspi_results' not in tables:
+        op.create_table(
+            'kaspi_results',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id'), nullable=True),
+            sa.Column('kaspi_name', sa.String(length=255), nullable=True),
+            sa.Column('kaspi_price', sa.Float(), nullable=True),
+            sa.Column('price_difference_percent', sa.Float(), nullable=True),
+            sa.Column('sellers', sa.Text(), nullable=True),
+            sa.Column('kaspi_url', sa.String(length=500), nullable=True)
+        )
+
+
+def downgrade():
+    op.drop_table('kaspi_results')
+    op.drop_table('products')
+    op.drop_table('comparisons')
@@ -0,0 +1,88 @@
+"""Upload keys, seller price details, catalog matches, comparison stats and SKU summaries
+
+Columns and tables that already exist (created by db.create_all() or added by
+hand) are skipped.
+
+Revision ID: 8a4e6b2c5d21
+Revises: 3f1c2a7d9b10
+Create Date: 2026-10-19 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6b2c5d21'
+down_revision = '3f1c2a7d9b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    comparison_columns = {column['name'] for column in inspector.get_columns('comparisons')}
+    result_columns = {column['name'] for column in inspector.get_columns('kaspi_results')}
+
+    if 'upload_key' not in comparison_columns:
+        with op.batch_alter_table('comparisons') as batch_op:
+            batch_op.add_column(sa.Column('upload_key', sa.String(length=64), nullable=True))
+            batch_op.create_unique_constraint('comparisons_upload_key_key', ['upload_key'])
+
+    missing = [
+        column for column in (
+            sa.Column('price_details', sa.Text(), nullable=True),
+            sa.Column('listing_id', sa.String(length=100), nullable=True),
+            sa.Column('match_score', sa.Float(), nullable=True)
+        )
+        if column.name not in result_columns
+    ]
+    if missing:
+        with op.batch_alter_table('kaspi_results') as batch_op:
+            for column in missing:
+                batch_op.add_column(column)
+
+    if 'sku_summaries' not in tables:
+        op.create_table(
+            'sku_summaries',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('sku', sa.String(length=100), nullable=False, unique=True),
+            sa.Column('model', sa.String(length=255), nullable=True),
+            sa.Column('first_seen', sa.DateTime(), nullable=True),
+            sa.Column('last_seen', sa.DateTime(), nullable=True),
+            sa.Column('observations', sa.Integer(), nullable=True),
+            sa.Column('our_price_min', sa.Float(), nullable=True),
+            sa.Column('our_price_max', sa.Float(), nullable=True),
+            sa.Column('our_price_sum', sa.Float(), nullable=True),
+            sa.Column('kaspi_price_min', sa.Float(), nullable=True),
+            sa.Column('kaspi_price_max', sa.Float(), nullable=True),
+            sa.Column('kaspi_price_sum', sa.Float(), nullable=True),
+            sa.Column('kaspi_observations', sa.Integer(), nullable=True),
+            sa.Column('last_our_price', sa.Float(), nullable=True),
+            sa.Column('last_kaspi_price', sa.Float(), nullable=True)
+        )
+
+    if 'comparison_stats' not in tables:
+        op.create_table(
+            'comparison_stats',
+            sa.Column('comparison_id', sa.Integer(), sa.ForeignKey('comparisons.id'), primary_key=True),
+            sa.Column('with_market_count', sa.Integer(), nullable=True),
+            sa.Column('cheapest_count', sa.Integer(), nullable=True),
+            sa.Column('above_market_count', sa.Integer(), nullable=True),
+            sa.Column('avg_diff_percent', sa.Float(), nullable=True),
+            sa.Column('median_diff_percent', sa.Float(), nullable=True),
+            sa.Column('min_diff_percent', sa.Float(), nullable=True),
+            sa.Column('computed_at', sa.DateTime(), nullable=True)
+        )
+
+
+def downgrade():
+    op.drop_table('comparison_stats')
+    op.drop_table('sku_summaries')
+    with op.batch_alter_table('kaspi_results') as batch_op:
+        batch_op.drop_column('match_score')
+        batch_op.drop_column('listing_id')
+        batch_op.drop_column('price_details')
+    with op.batch_alter_table('comparisons') as batch_op:
+        batch_op.drop_constraint('comparisons_upload_key_key', type_='unique')
+        batch_op.drop_column('upload_key')
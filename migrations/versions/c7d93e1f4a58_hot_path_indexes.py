@@ -0,0 +1,52 @@
+"""Indexes for the hot query paths
+
+- products (comparison_id, sku): products of a comparison (also serves lookups
+  by comparison_id alone) and a SKU within a comparison
+- products (sku): history of a SKU across comparisons
+- kaspi_results (product_id): market results of products
+- comparisons (created_at): history list and retention cutoff
+
+On PostgreSQL the indexes are built CONCURRENTLY so uploads are not blocked
+while large tables are indexed.
+
+Revision ID: c7d93e1f4a58
+Revises: 8a4e6b2c5d21
+Create Date: 2026-10-19 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d93e1f4a58'
+down_revision = '8a4e6b2c5d21'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_products_comparison_id_sku', 'products', ['comparison_id', 'sku']),
+    ('ix_products_sku', 'products', ['sku']),
+    ('ix_kaspi_results_product_id', 'kaspi_results', ['product_id']),
+    ('ix_comparisons_created_at', 'comparisons', ['created_at']),
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    postgresql = bind.dialect.name == 'postgresql'
+
+    for name, table, columns in INDEXES:
+        if name in {index['name'] for index in inspector.get_indexes(table)}:
+            continue
+        if postgresql:
+            # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+            with op.get_context().autocommit_block():
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+        else:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
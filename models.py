@@ -1,7 +1,7 @@
 import os
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, Index, JSON
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import json
@@ -13,17 +13,35 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+def database_now():
+    """
+    Current time of the database clock, comparable with DateTime columns
+
+    created_at is filled by func.now() of the database (UTC in SQLite, the server
+    time zone in PostgreSQL), so time windows are measured against this clock
+    rather than the local time of the process.
+    """
+    now = db.session.scalar(db.select(func.now()))
+    # PostgreSQL возвращает now() с часовым поясом, а колонки хранят время без него
+    return now.replace(tzinfo=None) if now.tzinfo is not None else now
+
 class Comparison(db.Model):
     __tablename__ = 'comparisons'
     
     id = Column(Integer, primary_key=True)
     filename = Column(String(255), nullable=True)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), index=True)  # История и свертка сортируют/фильтруют по дате
     products_count = Column(Integer, default=0)
+    # sha256 содержимого файла и параметров сканирования для повторных загрузок
+    upload_key = Column(String(64), unique=True, nullable=True)
     
     # Связь один-ко-многим с товарами
     products = relationship("Product", back_populates="comparison", cascade="all, delete-orphan")
     
+    # Агрегаты, посчитанные в конце сканирования (загружаются вместе со сравнением)
+    stats = relationship("ComparisonStats", back_populates="comparison", uselist=False,
+                         cascade="all, delete-orphan", lazy="joined")
+    
     def __repr__(self):
         return f"<Comparison id={self.id}, filename={self.filename}, products={self.products_count}>"
     
@@ -33,7 +51,8 @@ class Comparison(db.Model):
             "id": self.id,
             "filename": self.filename,
             "created_at": self.created_at.isoformat() if self.created_at else None,
-            "products_count": self.products_count
+            "products_count": self.products_count,
+            "stats": self.stats.to_dict() if self.stats else None
         }
         
         if include_products:
@@ -41,12 +60,44 @@ class Comparison(db.Model):
             
         return result
 
+class ComparisonStats(db.Model):
+    """Aggregate statistics of a comparison, computed once at the end of a scan"""
+    __tablename__ = 'comparison_stats'
+    
+    comparison_id = Column(Integer, ForeignKey('comparisons.id'), primary_key=True)
+    with_market_count = Column(Integer, default=0)  # Товары, для которых есть цена рынка
+    cheapest_count = Column(Integer, default=0)  # Наша цена не выше самой низкой на рынке
+    above_market_count = Column(Integer, default=0)  # На рынке есть цена ниже нашей
+    avg_diff_percent = Column(Float, nullable=True)
+    median_diff_percent = Column(Float, nullable=True)
+    min_diff_percent = Column(Float, nullable=True)
+    computed_at = Column(DateTime, default=func.now())
+    
+    comparison = relationship("Comparison", back_populates="stats")
+    
+    def __repr__(self):
+        return f"<ComparisonStats comparison_id={self.comparison_id}, cheapest={self.cheapest_count}>"
+    
+    def to_dict(self):
+        return {
+            "with_market_count": self.with_market_count,
+            "cheapest_count": self.cheapest_count,
+            "above_market_count": self.above_market_count,
+            "avg_diff_percent": self.avg_diff_percent,
+            "median_diff_percent": self.median_diff_percent,
+            "min_diff_percent": self.min_diff_percent
+        }
+
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Покрывает и выборки по одному comparison_id, отдельный индекс по нему не нужен
+        Index('ix_products_comparison_id_sku', 'comparison_id', 'sku'),
+    )
     
     id = Column(Integer, primary_key=True)
     comparison_id = Column(Integer, ForeignKey('comparisons.id'))
-    sku = Column(String(100))
+    sku = Column(String(100), index=True)
     model = Column(String(255))
     our_price = Column(Float)
     stock = Column(Integer)
@@ -74,12 +125,15 @@ class KaspiResult(db.Model):
     __tablename__ = 'kaspi_results'
     
     id = Column(Integer, primary_key=True)
-    product_id = Column(Integer, ForeignKey('products.id'))
+    product_id = Column(Integer, ForeignKey('products.id'), index=True)
     kaspi_name = Column(String(255))
     kaspi_price = Column(Float)
     price_difference_percent = Column(Float)
     sellers = Column(Text) # Хранится как JSON-строка
+    price_details = Column(Text, nullable=True) # Цены продавцов, JSON-строка [{seller, price, diff_percent}]
     kaspi_url = Column(String(500), nullable=True) # URL для проверки на Kaspi.kz
+    listing_id = Column(String(100), nullable=True) # id листинга из каталога Kaspi
+    match_score = Column(Float, nullable=True) # Оценка совпадения названия (0..1)
     
     # Связь многие-к-одному с товаром
     product = relationship("Product", back_populates="kaspi_results")
@@ -98,6 +152,17 @@ class KaspiResult(db.Model):
     def set_sellers(self, sellers_list):
         self.sellers = json.dumps(sellers_list) if sellers_list else "[]"
     
+    def get_price_details(self):
+        if not self.price_details:
+            return []
+        try:
+            return json.loads(self.price_details)
+        except json.JSONDecodeError:
+            return []
+    
+    def set_price_details(self, details_list):
+        self.price_details = json.dumps(details_list, ensure_ascii=False) if details_list else "[]"
+    
     def to_dict(self):
         return {
             "id": self.id,
@@ -105,5 +170,50 @@ class KaspiResult(db.Model):
             "kaspi_price": self.kaspi_price,
             "price_difference_percent": self.price_difference_percent,
             "sellers": self.get_sellers(),
-            "kaspi_url": self.kaspi_url if hasattr(self, 'kaspi_url') else None
-        }
\ No newline at end of file
+            "price_details": self.get_price_details(),
+            "kaspi_url": self.kaspi_url if hasattr(self, 'kaspi_url') else None,
+            "listing_id": self.listing_id,
+            "match_score": self.match_score
+        }
+
+class SkuSummary(db.Model):
+    """Compact per-SKU rollup of comparisons removed by retention"""
+    __tablename__ = 'sku_summaries'
+    
+    id = Column(Integer, primary_key=True)
+    sku = Column(String(100), unique=True, nullable=False)
+    model = Column(String(255))
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+    observations = Column(Integer, default=0)
+    
+    # Храним суммы и количество, чтобы средние можно было пересчитывать при следующих свертках
+    our_price_min = Column(Float)
+    our_price_max = Column(Float)
+    our_price_sum = Column(Float, default=0)
+    kaspi_price_min = Column(Float)
+    kaspi_price_max = Column(Float)
+    kaspi_price_sum = Column(Float, default=0)
+    kaspi_observations = Column(Integer, default=0)
+    last_our_price = Column(Float)
+    last_kaspi_price = Column(Float)
+    
+    def __repr__(self):
+        return f"<SkuSummary sku={self.sku}, observations={self.observations}>"
+    
+    def to_dict(self):
+        return {
+            "sku": self.sku,
+            "model": self.model,
+            "first_seen": self.first_seen.isoformat() if self.first_seen else None,
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
+            "observations": self.observations,
+            "our_price_min": self.our_price_min,
+            "our_price_max": self.our_price_max,
+            "our_price_avg": self.our_price_sum / self.observations if self.observations else None,
+            "kaspi_price_min": self.kaspi_price_min,
+            "kaspi_price_max": self.kaspi_price_max,
+            "kaspi_price_avg": self.kaspi_price_sum / self.kaspi_observations if self.kaspi_observations else None,
+            "last_our_price": self.last_our_price,
+            "last_kaspi_price": self.last_kaspi_price
+        }
@@ -7,6 +7,8 @@ import re
 import json
 import urllib.parse
 from datetime import datetime
+from matching import match_listing
+from records import SellerPrice, MarketResult, ScanItem, parse_number
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +25,7 @@ def extract_model_price_from_kaspi(model, our_price):
         our_price: Ваша цена для сравнения
         
     Returns:
-        List of dictionaries containing product information from Kaspi
+        List of MarketResult records with product information from Kaspi
     """
     logger.info(f"Анализ рынка для товара: {model} с нашей ценой {our_price}")
     
@@ -151,23 +153,25 @@ def extract_model_price_from_kaspi(model, our_price):
             else:
                 diff_percent = 0
                 
-            price_details.append({
-                "seller": seller["name"],
-                "price": seller["price"],
-                "diff_percent": round(diff_percent, 2)
-            })
+            price_details.append(SellerPrice(seller["name"], seller["price"], round(diff_percent, 2)))
             
         # Генерируем ссылку на Kaspi.kz для ручной проверки
         kaspi_url = f"https://kaspi.kz/shop/search/?text={urllib.parse.quote(model)}"
         
+        # Сопоставляем модель с листингом маркетплейса по индексу каталога
+        match, candidates = match_listing(model)
+        
         # Формируем основной результат
-        result = {
-            "kaspi_name": model,
-            "kaspi_price": str(min_price),
-            "sellers": sellers_list,
-            "price_details": price_details,
-            "kaspi_url": kaspi_url
-        }
+        result = MarketResult(
+            kaspi_name=match["name"] if match else model,
+            kaspi_price=float(min_price),
+            sellers=sellers_list,
+            price_details=price_details,
+            kaspi_url=(match.get("url") or kaspi_url) if match else kaspi_url,
+            listing_id=match["listing_id"] if match else None,
+            match_score=match["score"] if match else None,
+            match_candidates=candidates
+        )
         
         # Сохраняем данные в историю для последующего анализа
         key = normalize_name(model)
@@ -208,13 +212,13 @@ def extract_model_price_from_kaspi(model, our_price):
     # В случае ошибки, используем базовую информацию, но добавляем ссылку
     kaspi_url = f"https://kaspi.kz/shop/search/?text={urllib.parse.quote(model)}"
     logger.warning("Using fallback method for price comparison")
-    return [{
-        "kaspi_name": model,
-        "kaspi_price": str(our_price_value),
-        "price_difference_percent": 0,
-        "sellers": ["AIKOS"],
-        "kaspi_url": kaspi_url
-    }]
+    return [MarketResult(
+        kaspi_name=model,
+        kaspi_price=our_price_value,
+        sellers=["AIKOS"],
+        kaspi_url=kaspi_url,
+        price_difference_percent=0
+    )]
 
 # Используем вместо generate_demo_data основной метод extract_model_price_from_kaspi
 # Поэтому этот метод можно удалить
@@ -228,7 +232,20 @@ def process_xml_and_scan(content, max_items=100):
         max_items: Maximum number of items to process to prevent memory errors
         
     Returns:
-        List of dictionaries containing product information and comparison results
+        List of ScanItem records with product information and comparison results
+    """
+    return list(iter_xml_and_scan(content, max_items=max_items))
+
+def iter_xml_and_scan(content, max_items=100):
+    """
+    Process XML content item by item, yielding each analysed product as soon as it is ready
+    
+    Args:
+        content: XML content as bytes
+        max_items: Maximum number of items to process to prevent memory errors
+        
+    Yields:
+        ScanItem records with product information and comparison results
     """
     logger.info("Starting XML processing")
     logger.debug(f"XML content preview: {content[:500]}")
@@ -252,7 +269,7 @@ def process_xml_and_scan(content, max_items=100):
             root = ET.fromstring(content)
             namespaces = {}
         
-        results = []
+        processed_count = 0
         
         # Вывести корневой элемент и первый уровень структуры
         logger.info(f"XML root tag: {root.tag}")
@@ -450,12 +467,12 @@ def process_xml_and_scan(content, max_items=100):
                 
                 logger.info(f"Extracted product data - SKU: {sku}, Model: {model}, Price: {price}, Stock: {stock}")
                 
-                # Clean price value
-                try:
-                    price_value = float(price.replace(',', '.').strip())
-                except ValueError:
+                # Clean price and stock values
+                price_value = parse_number(price, default=None)
+                if price_value is None:
                     logger.warning(f"Invalid price format for SKU {sku}: {price}")
-                    price_value = 0
+                    price_value = 0.0
+                stock_value = int(parse_number(stock))
                 
                 # Search for the product on Kaspi
                 search_results = extract_model_price_from_kaspi(model, price_value)
@@ -465,28 +482,29 @@ def process_xml_and_scan(content, max_items=100):
                 if search_results:
                     for result in search_results:
                         try:
-                            kaspi_price_str = result.get('kaspi_price', '0')
-                            kaspi_price = float(kaspi_price_str.replace(',', '.').strip())
-                            diff = ((kaspi_price - price_value) / price_value) * 100 if price_value > 0 else 0
-                            result['price_difference_percent'] = round(diff, 2)
+                            diff = ((result.kaspi_price - price_value) / price_value) * 100 if price_value > 0 else 0
+                            result.price_difference_percent = round(diff, 2)
                         except (ValueError, TypeError) as e:
                             logger.warning(f"Error calculating price difference: {str(e)}")
-                            result['price_difference_percent'] = None
+                            result.price_difference_percent = None
                 
-                results.append({
-                    "sku": sku,
-                    "model": model,
-                    "our_price": price,
-                    "stock": stock,
-                    "kaspi_results": search_results
-                })
+                scan_item = ScanItem(
+                    sku=sku,
+                    model=model,
+                    our_price=price_value,
+                    stock=stock_value,
+                    kaspi_results=search_results
+                )
                 
             except Exception as e:
                 logger.error(f"Error processing item: {str(e)}")
                 continue
+            
+            # Отдаем товар сразу, не дожидаясь обработки всего файла
+            processed_count += 1
+            yield scan_item
         
-        logger.info(f"XML processing completed. Processed {len(results)} products.")
-        return results
+        logger.info(f"XML processing completed. Processed {processed_count} products.")
         
     except ET.ParseError as e:
         logger.error(f"XML parse error: {str(e)}")
@@ -0,0 +1,173 @@
+import os
+import queue
+import logging
+import threading
+
+from parser import iter_xml_and_scan
+from models import db, Comparison, ComparisonStats, Product, KaspiResult
+from stats import StatsAccumulator
+from profiling import follow_thread
+
+logger = logging.getLogger(__name__)
+
+# Сколько проанализированных товаров может ждать записи (при заполнении анализ приостанавливается)
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 64))
+
+# Сколько товаров отправляется в базу одним flush
+PIPELINE_CHUNK_SIZE = int(os.environ.get("PIPELINE_CHUNK_SIZE", 25))
+
+# Как часто поток анализа проверяет, не остановлен ли конвейер, пока очередь заполнена
+_PUT_TIMEOUT_SECONDS = 0.5
+
+_DONE = object()
+
+
+class _ProducerFailure:
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(out_queue, entry, stop_event):
+    """
+    Put an entry into the bounded queue, waiting while it is full
+
+    Returns False if the pipeline was stopped before the entry fit in.
+    """
+    while not stop_event.is_set():
+        try:
+            out_queue.put(entry, timeout=_PUT_TIMEOUT_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(items, out_queue, stop_event):
+    """Analyse items in a background thread and feed them into the bounded queue"""
+    try:
+        for item in items:
+            # Ожидание свободного места в очереди дает обратное давление: пока запись отстает, анализ ждет
+            if not _put(out_queue, item, stop_event):
+                return
+        _put(out_queue, _DONE, stop_event)
+    except Exception as e:
+        logger.error(f"Error in scan analysis: {str(e)}")
+        _put(out_queue, _ProducerFailure(e), stop_event)
+    finally:
+        items.close()
+
+
+def build_product(comparison_id, item):
+    """Build Product and KaspiResult rows for one ScanItem"""
+    product = Product(
+        comparison_id=comparison_id,
+        sku=item.sku,
+        model=item.model,
+        our_price=item.our_price,
+        stock=item.stock
+    )
+    for market_result in item.kaspi_results:
+        result = KaspiResult(
+            kaspi_name=market_result.kaspi_name,
+            kaspi_price=market_result.kaspi_price,
+            price_difference_percent=market_result.price_difference_percent,
+            kaspi_url=market_result.kaspi_url,
+            listing_id=market_result.listing_id,
+            match_score=market_result.match_score
+        )
+        # Сохраняем список продавцов и их цены как JSON
+        result.set_sellers(list(market_result.sellers))
+        result.set_price_details([detail.to_dict() for detail in market_result.price_details])
+        product.kaspi_results.append(result)
+    return product
+
+
+def _write_chunk(comparison_id, chunk):
+    """Send one chunk of products to the database inside the open transaction"""
+    products = [build_product(comparison_id, item) for item in chunk]
+    db.session.add_all(products)
+    db.session.flush()
+    # Записанные строки больше не нужны сессии - освобождаем память
+    for product in products:
+        db.session.expunge(product)
+
+
+def run_scan_pipeline(content, max_items, filename, upload_key=None):
+    """
+    Analyse an uploaded feed and persist it while the analysis is still running
+
+    Items are analysed in a background thread and passed through a bounded queue
+    to the request thread, which flushes them to the database in chunks. Everything
+    happens in one transaction: the comparison becomes visible only after the final
+    commit, and any failure rolls back all chunks written so far.
+
+    Args:
+        content: XML content as bytes
+        max_items: Maximum number of items to process
+        filename: Secure name of the uploaded file
+        upload_key: Content hash for duplicate detection
+
+    Returns:
+        Tuple (saved Comparison, list of ScanItem records)
+    """
+    items = []
+    accumulator = StatsAccumulator()
+    stop_event = threading.Event()
+    item_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    producer = None
+
+    try:
+        if upload_key:
+            # Ключ уникален: у устаревшего сравнения с тем же содержимым его освобождаем
+            Comparison.query.filter_by(upload_key=upload_key).update({"upload_key": None})
+
+        comparison = Comparison(filename=filename, products_count=0, upload_key=upload_key)
+        db.session.add(comparison)
+        db.session.flush()
+        comparison_id = comparison.id
+
+        producer = threading.Thread(
+            target=_produce,
+            args=(iter_xml_and_scan(content, max_items=max_items), item_queue, stop_event),
+            name=f"scan-analysis-{comparison_id}",
+            daemon=True
+        )
+        producer.start()
+        # Анализ идет в этом потоке - при профилировании запроса сэмплируем и его
+        follow_thread(producer)
+
+        chunk = []
+        while True:
+            entry = item_queue.get()
+            if entry is _DONE:
+                break
+            if isinstance(entry, _ProducerFailure):
+                raise entry.error
+            items.append(entry)
+            accumulator.add_item(entry)
+            chunk.append(entry)
+            if len(chunk) >= PIPELINE_CHUNK_SIZE:
+                _write_chunk(comparison_id, chunk)
+                chunk = []
+
+        if chunk:
+            _write_chunk(comparison_id, chunk)
+
+        comparison.products_count = len(items)
+        # Агрегаты считаем по ходу сканирования, чтобы история не читала товары
+        db.session.add(ComparisonStats(comparison_id=comparison_id, **accumulator.result()))
+        db.session.commit()
+        logger.info(f"Saved comparison #{comparison_id} to database with {len(items)} products")
+        return comparison, items
+
+    except BaseException:
+        stop_event.set()
+        db.session.rollback()
+        raise
+
+    finally:
+        if producer is not None:
+            stop_event.set()
+            producer.join()
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import hmac
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+
+from flask import request, jsonify, make_response
+
+logger = logging.getLogger(__name__)
+
+# Токен, разрешающий профилирование запроса (пусто - профилирование отключено)
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+
+# Каталог для профилей и сколько последних файлов в нем хранить
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 20))
+
+# Интервал сэмплирования стека в миллисекундах
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", 5))
+
+# Сколько кадров стека сохраняет tracemalloc и сколько строк попадает в отчет
+_TRACEMALLOC_FRAMES = 10
+_TOP_ENTRIES = 20
+
+# tracemalloc глобален для процесса, поэтому одновременно профилируется только один запрос
+_profile_lock = threading.Lock()
+
+
+def _is_authorized():
+    """Check the profiling token from the X-Profile-Token header or ?profile= parameter"""
+    if not PROFILE_TOKEN:
+        return False
+    token = request.headers.get("X-Profile-Token") or request.args.get("profile") or ""
+    return hmac.compare_digest(token.encode('utf-8'), PROFILE_TOKEN.encode('utf-8'))
+
+
+def _frame_label(code):
+    return f"{code.co_filename}:{code.co_firstlineno}:{code.co_name}"
+
+
+class StackSampler:
+    """
+    Sampling CPU profiler for a request thread and the threads it hands work to
+
+    A background thread reads the current frame of every followed thread each
+    interval and counts functions on top of the stack (self time) and anywhere in
+    it (cumulative time). Samples of a thread blocked inside threading (a request
+    thread waiting on the scan pipeline queue) are counted as idle, so the report
+    shows where work is actually done.
+    """
+
+    def __init__(self, thread_id, interval_ms=None):
+        self.thread_id = thread_id
+        self.interval = (interval_ms or PROFILE_SAMPLE_INTERVAL_MS) / 1000
+        self.threads = {thread_id: "request"}
+        self.samples = 0
+        self.idle_samples = 0
+        self.self_counts = Counter()
+        self.cumulative_counts = Counter()
+        self.thread_counts = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def add_thread(self, thread):
+        """Sample another thread as part of this profile"""
+        self.threads[thread.ident] = thread.name
+
+    def follows(self, thread_id):
+        return thread_id in self.threads
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, name in list(self.threads.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                counts = self.thread_counts.setdefault(name, {"samples": 0, "idle_samples": 0, "self": Counter()})
+                if _is_idle(frame):
+                    self.idle_samples += 1
+                    counts["idle_samples"] += 1
+                    continue
+                self.samples += 1
+                counts["samples"] += 1
+                label = _frame_label(frame.f_code)
+                self.self_counts[label] += 1
+                counts["self"][label] += 1
+                seen = set()
+                while frame is not None:
+                    label = _frame_label(frame.f_code)
+                    if label not in seen:
+                        seen.add(label)
+                        self.cumulative_counts[label] += 1
+                    frame = frame.f_back
+
+    def report(self):
+        def _top(counts, total, limit=_TOP_ENTRIES):
+            return [
+                {"function": label, "samples": count, "percent": round(count * 100 / total, 1)}
+                for label, count in counts.most_common(limit)
+            ] if total else []
+
+        return {
+            "samples": self.samples,
+            "idle_samples": self.idle_samples,
+            "interval_ms": self.interval * 1000,
+            "hottest_self": _top(self.self_counts, self.samples),
+            "hottest_cumulative": _top(self.cumulative_counts, self.samples),
+            "threads": {
+                name: {
+                    "samples": counts["samples"],
+                    "idle_samples": counts["idle_samples"],
+                    "hottest_self": _top(counts["self"], counts["samples"], limit=5)
+                }
+                for name, counts in self.thread_counts.items()
+            }
+        }
+
+
+def _is_idle(frame):
+    """True if the thread is blocked inside threading (Condition/Event wait, Queue.get, join)"""
+    return frame.f_code.co_filename == threading.__file__
+
+
+# Сэмплер профилируемого запроса (из-за _profile_lock он может быть только один)
+_active_sampler = None
+
+
+def follow_thread(thread):
+    """
+    Include a started worker thread in the profile of the current request
+
+    Does nothing unless the calling thread is being profiled, so work started by
+    other concurrent requests does not leak into the profile.
+    """
+    sampler = _active_sampler
+    if sampler is not None and sampler.follows(threading.get_ident()):
+        sampler.add_thread(thread)
+
+
+def _top_allocators(before, after):
+    """Allocation growth between two tracemalloc snapshots, grouped by source line"""
+    # Собственные выделения профилировщика в отчет не попадают
+    filters = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+    return [
+        {
+            "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_diff": stat.size_diff,
+            "count_diff": stat.count_diff,
+            "size": stat.size
+        }
+        for stat in stats[:_TOP_ENTRIES]
+    ]
+
+
+def _write_profile(profile):
+    """Write a profile to PROFILE_DIR and delete the oldest files beyond PROFILE_KEEP"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{profile['endpoint']}.json"
+    with open(os.path.join(PROFILE_DIR, name), 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False)
+
+    files = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith('.json'))
+    for old in files[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else []:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old))
+        except OSError as e:
+            logger.warning(f"Error removing old profile {old}: {str(e)}")
+    return name
+
+
+def profiled(view):
+    """
+    Profile a view with a sampling CPU profiler and tracemalloc snapshots
+
+    Only authorized requests are profiled (see PROFILE_TOKEN); everything else
+    runs the view unchanged.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        global _active_sampler
+        if not _is_authorized():
+            return view(*args, **kwargs)
+        if not _profile_lock.acquire(blocking=False):
+            logger.info("Another request is being profiled, running without profiling")
+            return view(*args, **kwargs)
+
+        try:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(_TRACEMALLOC_FRAMES)
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            sampler = StackSampler(threading.get_ident())
+
+            started_at = datetime.now()
+            started = time.perf_counter()
+            _active_sampler = sampler
+            sampler.start()
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                _active_sampler = None
+                sampler.stop()
+                duration = time.perf_counter() - started
+                after = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                if started_tracing:
+                    tracemalloc.stop()
+
+            profile = {
+                "endpoint": view.__name__,
+                "path": request.path,
+                "started_at": started_at.isoformat(),
+                "duration_seconds": round(duration, 4),
+                "peak_traced_bytes": peak,
+                "cpu": sampler.report(),
+                "top_allocators": _top_allocators(before, after)
+            }
+            name = _write_profile(profile)
+            logger.info(f"Saved profile {name} for {request.path} ({duration:.3f}s)")
+        finally:
+            _profile_lock.release()
+
+        response.headers["X-Profile-Id"] = name
+        return response
+
+    return wrapper
+
+
+def list_profiles(limit=10, top=10):
+    """Summaries of the most recent profiles, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    files = sorted((f for f in os.listdir(PROFILE_DIR) if f.endswith('.json')), reverse=True)[:limit]
+    summaries = []
+    for name in files:
+        try:
+            with open(os.path.join(PROFILE_DIR, name), 'r', encoding='utf-8') as f:
+                profile = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Error reading profile {name}: {str(e)}")
+            continue
+        summaries.append({
+            "id": name,
+            "endpoint": profile.get("endpoint"),
+            "path": profile.get("path"),
+            "started_at": profile.get("started_at"),
+            "duration_seconds": profile.get("duration_seconds"),
+            "peak_traced_bytes": profile.get("peak_traced_bytes"),
+            "hottest_functions": profile.get("cpu", {}).get("hottest_self", [])[:top],
+            "top_allocators": profile.get("top_allocators", [])[:top]
+        })
+    return summaries
+
+
+def profiles_view():
+    """List top allocators and hottest functions of recent profiled requests"""
+    if not _is_authorized():
+        return jsonify({"error": "Not found"}), 404
+    limit = request.args.get('limit', 10, type=int)
+    top = request.args.get('top', 10, type=int)
+    return jsonify(list_profiles(limit=limit, top=top))
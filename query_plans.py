@@ -0,0 +1,112 @@
+import re
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import selectinload
+from models import db, Comparison, Product, KaspiResult
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, которые растут с каждой загрузкой; полный проход по ним считается ошибкой
+LARGE_TABLES = ('comparisons', 'products', 'kaspi_results')
+
+_PG_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+def hot_path_queries(comparison_id=1, sku='SKU-1', product_ids=(1, 2, 3)):
+    """
+    Queries of the main endpoints and jobs, as (name, statement) pairs
+
+    The statements repeat the ones used in main.py, repricing.py, stats.py and
+    retention.py with sample parameter values.
+    """
+    cutoff = datetime.now() - timedelta(days=90)
+    return [
+        # /history и /api/comparisons
+        ("comparison_history", select(Comparison).order_by(Comparison.created_at.desc())),
+        # /api/comparison/<id>: товары и их результаты (ленивая загрузка по product_id)
+        ("comparison_products", select(Product).where(Product.comparison_id == comparison_id).limit(50)),
+        ("product_results", select(KaspiResult).where(KaspiResult.product_id == product_ids[0])),
+        # Повторная загрузка: товары сравнения и selectinload результатов
+        ("scan_items", select(Product).where(Product.comparison_id == comparison_id)
+            .options(selectinload(Product.kaspi_results)).order_by(Product.id)),
+        ("scan_items_results", select(KaspiResult).where(KaspiResult.product_id.in_(list(product_ids)))),
+        # Переоценка и статистика сравнения
+        ("pricing_columns", select(Product.id, Product.sku, Product.model, Product.stock, Product.our_price,
+                                   KaspiResult.price_details)
+            .outerjoin(KaspiResult, KaspiResult.product_id == Product.id)
+            .where(Product.comparison_id == comparison_id)
+            .order_by(Product.id)),
+        ("comparison_stats", select(func.min(KaspiResult.price_difference_percent))
+            .select_from(Product)
+            .outerjoin(KaspiResult, KaspiResult.product_id == Product.id)
+            .where(Product.comparison_id == comparison_id)
+            .group_by(Product.id)),
+        # Поиск по SKU: в одном сравнении и по всей истории
+        ("comparison_sku", select(Product).where(Product.comparison_id == comparison_id, Product.sku == sku)),
+        ("sku_history", select(Product).where(Product.sku == sku)),
+        # Свертка истории
+        ("retention_candidates", select(Comparison).where(Comparison.created_at < cutoff)
+            .order_by(Comparison.created_at)),
+    ]
+
+
+def _explain(connection, statement):
+    """Query plan of a statement as a list of text lines"""
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if connection.dialect.name == 'postgresql':
+        rows = connection.exec_driver_sql("EXPLAIN " + compiled.string, params).all()
+        return [row[0] for row in rows]
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + compiled.string, params).all()
+        return [row[-1] for row in rows]
+    raise ValueError(f"EXPLAIN is not supported for {connection.dialect.name}")
+
+
+def sequential_scans(plan, dialect_name):
+    """Large tables read in full according to a query plan"""
+    tables = set()
+    for line in plan:
+        if dialect_name == 'postgresql':
+            match = _PG_SEQ_SCAN.search(line)
+        else:
+            match = _SQLITE_SCAN.match(line.strip())
+            if match and 'USING' in line:
+                match = None
+        if match and match.group(1) in LARGE_TABLES:
+            tables.add(match.group(1))
+    return sorted(tables)
+
+
+def explain_hot_paths():
+    """
+    Run EXPLAIN for every hot path query and find sequential scans of large tables
+
+    On PostgreSQL sequential scans are disabled for the check, so a "Seq Scan" in
+    the plan means no usable index exists rather than the planner preferring a
+    full scan of a small table.
+
+    Returns:
+        List of dicts with name, plan lines and sequential_scans
+    """
+    connection = db.session.connection()
+    dialect_name = connection.dialect.name
+    reports = []
+    try:
+        if dialect_name == 'postgresql':
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        for name, statement in hot_path_queries():
+            plan = _explain(connection, statement)
+            scans = sequential_scans(plan, dialect_name)
+            if scans:
+                logger.warning(f"Query {name} reads {', '.join(scans)} sequentially")
+            reports.append({"name": name, "plan": plan, "sequential_scans": scans})
+    finally:
+        db.session.rollback()
+    return reports
@@ -0,0 +1,132 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def parse_number(value, default=0.0):
+    """Convert a price-like string ("349 990,50") to float, returning default on failure"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(' ', '').replace('\xa0', '').replace(',', '.').strip())
+    except ValueError:
+        return default
+
+
+def format_number(value):
+    """Format a number as a string the way the API always returned it, without a trailing .0"""
+    if value is None:
+        return None
+    value = float(value)
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+class SellerPrice:
+    """Price of a single seller for a product (stock is None when the market gives no signal)"""
+    __slots__ = ('seller', 'price', 'diff_percent', 'stock')
+
+    def __init__(self, seller, price, diff_percent=0.0, stock=None):
+        self.seller = seller
+        self.price = price
+        self.diff_percent = diff_percent
+        self.stock = stock
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("seller"), data.get("price"), data.get("diff_percent", 0.0), data.get("stock"))
+
+    def to_dict(self):
+        result = {
+            "seller": self.seller,
+            "price": self.price,
+            "diff_percent": self.diff_percent
+        }
+        if self.stock is not None:
+            result["stock"] = self.stock
+        return result
+
+
+class MarketResult:
+    """Result of the market analysis for one product"""
+    __slots__ = (
+        'kaspi_name', 'kaspi_price', 'sellers', 'price_details', 'kaspi_url',
+        'price_difference_percent', 'listing_id', 'match_score', 'match_candidates'
+    )
+
+    def __init__(self, kaspi_name, kaspi_price, sellers=(), price_details=(), kaspi_url=None,
+                 price_difference_percent=None, listing_id=None, match_score=None, match_candidates=()):
+        self.kaspi_name = kaspi_name
+        self.kaspi_price = kaspi_price
+        self.sellers = tuple(sellers)
+        self.price_details = tuple(price_details)
+        self.kaspi_url = kaspi_url
+        self.price_difference_percent = price_difference_percent
+        self.listing_id = listing_id
+        self.match_score = match_score
+        self.match_candidates = tuple(match_candidates)
+
+    @classmethod
+    def from_kaspi_result(cls, result):
+        """Build a record from a saved KaspiResult row"""
+        return cls(
+            kaspi_name=result.kaspi_name,
+            kaspi_price=result.kaspi_price,
+            sellers=result.get_sellers(),
+            price_details=[SellerPrice.from_dict(d) for d in result.get_price_details()],
+            kaspi_url=result.kaspi_url,
+            price_difference_percent=result.price_difference_percent,
+            listing_id=result.listing_id,
+            match_score=result.match_score
+        )
+
+    def to_dict(self):
+        result = {
+            "kaspi_name": self.kaspi_name,
+            "kaspi_price": format_number(self.kaspi_price),
+            "sellers": list(self.sellers),
+            "kaspi_url": self.kaspi_url,
+            "price_difference_percent": self.price_difference_percent,
+            "listing_id": self.listing_id,
+            "match_score": self.match_score,
+            "match_candidates": list(self.match_candidates)
+        }
+        if self.price_details:
+            result["price_details"] = [detail.to_dict() for detail in self.price_details]
+        return result
+
+
+class ScanItem:
+    """One product from the uploaded feed together with its market results"""
+    __slots__ = ('sku', 'model', 'our_price', 'stock', 'kaspi_results')
+
+    def __init__(self, sku, model, our_price, stock, kaspi_results=()):
+        self.sku = sku
+        self.model = model
+        self.our_price = our_price
+        self.stock = stock
+        self.kaspi_results = list(kaspi_results)
+
+    @classmethod
+    def from_product(cls, product):
+        """Build a record from a saved Product row and its Kaspi results"""
+        return cls(
+            sku=product.sku,
+            model=product.model,
+            our_price=product.our_price,
+            stock=product.stock,
+            kaspi_results=[MarketResult.from_kaspi_result(r) for r in product.kaspi_results]
+        )
+
+    def to_dict(self, comparison_id=None):
+        result = {
+            "sku": self.sku,
+            "model": self.model,
+            "our_price": format_number(self.our_price),
+            "stock": str(self.stock),
+            "kaspi_results": [r.to_dict() for r in self.kaspi_results]
+        }
+        if comparison_id is not None:
+            result["comparison_id"] = comparison_id
+        return result
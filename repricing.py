@@ -0,0 +1,315 @@
+import os
+import json
+import math
+import logging
+from xml.sax.saxutils import escape, quoteattr
+from datetime import datetime
+
+from sqlalchemy import select
+from models import db, Product, KaspiResult
+
+logger = logging.getLogger(__name__)
+
+# Название нашего магазина среди продавцов Kaspi - его цены не считаются конкурентными
+OUR_SELLER_NAME = os.environ.get("OUR_SELLER_NAME", "AIKOS")
+
+# Реквизиты для выгрузки прайс-листа в формате Kaspi
+KASPI_COMPANY_NAME = os.environ.get("KASPI_COMPANY_NAME", OUR_SELLER_NAME)
+KASPI_MERCHANT_ID = os.environ.get("KASPI_MERCHANT_ID", "")
+KASPI_STORE_ID = os.environ.get("KASPI_STORE_ID", "PP1")
+
+KASPI_XML_NAMESPACE = "kaspiShopping"
+
+
+def _finite_number(value, name):
+    """Convert a rule or cost value to float, rejecting NaN and infinity"""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{name} must be a finite number")
+    return number
+
+
+def parse_costs(raw_costs):
+    """
+    Validate a sku -> cost mapping from request JSON or a costs file
+
+    Returns:
+        Dictionary str(sku) -> float cost
+
+    Raises:
+        ValueError: if the mapping is not an object or a cost is not a finite number
+    """
+    if not isinstance(raw_costs, dict):
+        raise ValueError("costs must be an object mapping sku to cost")
+    return {str(sku): _finite_number(cost, f"cost of {sku}") for sku, cost in raw_costs.items()}
+
+
+class RepricingRules:
+    """
+    Rule set for computing recommended prices
+
+    undercut: Beat the cheapest competitor by this many tenge
+    min_margin_percent: Never go below cost * (1 + margin / 100) when the cost is known
+    round_to: Round prices to this step, like the market analysis does (100 tenge)
+    min_seller_stock: Ignore competitors whose known stock is below this value
+    our_seller: Our seller name, excluded from competitors
+    """
+    __slots__ = ('undercut', 'min_margin_percent', 'round_to', 'min_seller_stock', 'our_seller')
+
+    def __init__(self, undercut=100, min_margin_percent=0, round_to=100, min_seller_stock=None, our_seller=None):
+        self.undercut = _finite_number(undercut, 'undercut')
+        self.min_margin_percent = _finite_number(min_margin_percent, 'min_margin_percent')
+        self.round_to = int(_finite_number(round_to, 'round_to')) if round_to else 0
+        if self.round_to < 0:
+            raise ValueError("round_to must not be negative")
+        self.min_seller_stock = (int(_finite_number(min_seller_stock, 'min_seller_stock'))
+                                 if min_seller_stock is not None else None)
+        self.our_seller = our_seller or OUR_SELLER_NAME
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build rules from request JSON, ignoring unknown keys"""
+        data = data or {}
+        return cls(**{key: data[key] for key in cls.__slots__ if data.get(key) is not None})
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class PriceRecommendation:
+    """Recommended price for one SKU"""
+    __slots__ = ('sku', 'model', 'stock', 'our_price', 'competitor_price', 'competitor', 'min_price',
+                 'recommended_price', 'reason')
+
+    def __init__(self, sku, model, stock, our_price, competitor_price, competitor, min_price,
+                 recommended_price, reason):
+        self.sku = sku
+        self.model = model
+        self.stock = stock
+        self.our_price = our_price
+        self.competitor_price = competitor_price
+        self.competitor = competitor
+        self.min_price = min_price
+        self.recommended_price = recommended_price
+        self.reason = reason
+
+    @property
+    def change(self):
+        return self.recommended_price - (self.our_price or 0)
+
+    def to_dict(self):
+        return {
+            "sku": self.sku,
+            "model": self.model,
+            "stock": self.stock,
+            "our_price": self.our_price,
+            "competitor_price": self.competitor_price,
+            "competitor": self.competitor,
+            "min_price": self.min_price,
+            "recommended_price": self.recommended_price,
+            "change": self.change,
+            "reason": self.reason
+        }
+
+
+def load_pricing_columns(comparison_id):
+    """
+    Load everything repricing needs for a comparison with a single query
+
+    Returns:
+        Tuple of parallel lists (skus, models, stocks, our_prices, price_details),
+        where price_details holds the seller price dicts of all Kaspi results of a product
+    """
+    # Запрос через Core-соединение: ORM-обработка строк здесь не нужна. Строки не
+    # собираем в список: 100 тыс. живых Row заметно удорожают сборку мусора при разборе JSON
+    rows = db.session.connection().execute(
+        select(Product.id, Product.sku, Product.model, Product.stock, Product.our_price, KaspiResult.price_details)
+        .outerjoin(KaspiResult, KaspiResult.product_id == Product.id)
+        .where(Product.comparison_id == comparison_id)
+        .order_by(Product.id)
+    )
+
+    skus, models, stocks, our_prices, counts = [], [], [], [], []
+    raw_details = []  # JSON-массивы всех результатов подряд, counts - сколько их у каждого товара
+    last_product_id = None
+    for product_id, sku, model, stock, our_price, price_details in rows:
+        if product_id != last_product_id:
+            last_product_id = product_id
+            skus.append(sku)
+            models.append(model)
+            stocks.append(stock or 0)
+            our_prices.append(our_price or 0.0)
+            counts.append(0)
+        # У товара может быть несколько результатов Kaspi - собираем JSON-массивы всех
+        if price_details:
+            raw_details.append(price_details)
+            counts[-1] += 1
+
+    # Разбираем JSON всех результатов одним вызовом вместо json.loads на каждую строку
+    try:
+        decoded = json.loads('[' + ','.join(raw_details) + ']')
+    except json.JSONDecodeError:
+        logger.warning("Invalid price_details JSON, decoding rows one by one")
+        decoded = [_safe_json_list(raw) for raw in raw_details]
+
+    details = []
+    position = 0
+    for count in counts:
+        if count == 1:
+            part = decoded[position]
+            details.append(part if isinstance(part, list) else [])
+        else:
+            merged = []
+            for part in decoded[position:position + count]:
+                if isinstance(part, list):
+                    merged.extend(part)
+            details.append(merged)
+        position += count
+    return skus, models, stocks, our_prices, details
+
+
+def _safe_json_list(raw):
+    try:
+        value = json.loads(raw)
+    except json.JSONDecodeError:
+        return []
+    return value if isinstance(value, list) else []
+
+
+def compute_recommendations(skus, models, stocks, our_prices, details, rules, costs=None):
+    """
+    Compute recommended prices for all SKUs in one pass over column lists
+
+    The price beats the cheapest eligible competitor by `rules.undercut`, is rounded
+    down to `rules.round_to` so it stays below the competitor, and is never lower
+    than cost plus margin (rounded up) or one rounding step. SKUs without competitors
+    keep their price; if it is unknown the reason is "invalid_price".
+
+    Returns:
+        List of PriceRecommendation records in input order
+    """
+    costs = costs or {}
+    step = rules.round_to
+    undercut = rules.undercut
+    margin = 1 + rules.min_margin_percent / 100
+    our_seller = rules.our_seller
+    min_stock = rules.min_seller_stock
+    ceil_div = math.ceil
+    # Самая низкая допустимая цена после опережения конкурента
+    lowest = step or 1
+
+    recommendations = []
+    append = recommendations.append
+    for sku, model, stock, our_price, sellers in zip(skus, models, stocks, our_prices, details):
+        # Самый дешевый подходящий конкурент
+        competitor_price = None
+        competitor = None
+        for detail in sellers:
+            price = detail.get("price")
+            if not price or (competitor_price is not None and price >= competitor_price):
+                continue
+            seller = detail.get("seller")
+            if seller == our_seller:
+                continue
+            if min_stock is not None:
+                seller_stock = detail.get("stock")
+                if seller_stock is not None and seller_stock < min_stock:
+                    continue
+            competitor_price = price
+            competitor = seller
+
+        cost = costs.get(sku)
+        min_price = None
+        if cost:
+            min_price = cost * margin
+            if step:
+                # round() убирает погрешность float, иначе 330000 * 1.1 округлится вверх до 363100
+                min_price = ceil_div(round(min_price / step, 6)) * step
+
+        if competitor_price is None:
+            recommended = our_price
+            reason = "no_competitors"
+        else:
+            recommended = competitor_price - undercut
+            if step:
+                # Деление с остатком точно для целых цен и не поднимает цену до цены конкурента
+                recommended = recommended // step * step
+            if recommended < lowest:
+                recommended = lowest
+            reason = "undercut"
+
+        if min_price is not None and recommended < min_price:
+            recommended = min_price
+            reason = "margin_floor"
+        elif recommended <= 0:
+            # Нет ни конкурентов, ни нашей цены - такую позицию в прайс-лист не выгружаем
+            reason = "invalid_price"
+
+        append(PriceRecommendation(
+            sku, model, stock, our_price, competitor_price, competitor, min_price, float(recommended), reason
+        ))
+    return recommendations
+
+
+def reprice_comparison(comparison_id, rules, costs=None):
+    """Load a comparison and compute recommended prices for every SKU"""
+    started = datetime.now()
+    columns = load_pricing_columns(comparison_id)
+    recommendations = compute_recommendations(*columns, rules=rules, costs=costs)
+    elapsed = (datetime.now() - started).total_seconds()
+    logger.info(f"Repriced {len(recommendations)} SKUs of comparison #{comparison_id} in {elapsed:.3f}s")
+    return recommendations
+
+
+def summarize_recommendations(recommendations):
+    """Count recommendations by reason and direction of the price change"""
+    summary = {"total": len(recommendations), "lowered": 0, "raised": 0, "unchanged": 0}
+    for rec in recommendations:
+        summary[rec.reason] = summary.get(rec.reason, 0) + 1
+        change = rec.change
+        if change < 0:
+            summary["lowered"] += 1
+        elif change > 0:
+            summary["raised"] += 1
+        else:
+            summary["unchanged"] += 1
+    return summary
+
+
+def build_price_xml(recommendations, company=None, merchant_id=None, store_id=None):
+    """
+    Render recommendations as a Kaspi price list XML (kaspi_catalog format)
+
+    The document is written as escaped string chunks: for 100k offers this is
+    several times faster than building an ElementTree. Offers without a positive
+    price are left out.
+
+    Returns:
+        XML document as UTF-8 bytes
+    """
+    store_attr = quoteattr(store_id or KASPI_STORE_ID)
+    chunks = [
+        '<?xml version="1.0" encoding="utf-8"?>\n',
+        f'<kaspi_catalog date={quoteattr(datetime.now().strftime("%Y-%m-%d %H:%M"))} xmlns="{KASPI_XML_NAMESPACE}">\n',
+        f'  <company>{escape(company or KASPI_COMPANY_NAME)}</company>\n',
+        f'  <merchantid>{escape(merchant_id or KASPI_MERCHANT_ID)}</merchantid>\n',
+        '  <offers>\n'
+    ]
+    append = chunks.append
+    skipped = 0
+    for rec in recommendations:
+        if not rec.recommended_price > 0:
+            skipped += 1
+            continue
+        available = 'yes' if rec.stock and rec.stock > 0 else 'no'
+        append(
+            f'    <offer sku={quoteattr(rec.sku or "")}>'
+            f'<model>{escape(rec.model or "")}</model>'
+            f'<availabilities><availability available="{available}" storeId={store_attr}/></availabilities>'
+            f'<price>{int(round(rec.recommended_price))}</price>'
+            '</offer>\n'
+        )
+    chunks.append('  </offers>\n</kaspi_catalog>\n')
+    if skipped:
+        logger.warning(f"Price list: skipped {skipped} offers without a positive price")
+    return ''.join(chunks).encode('utf-8')
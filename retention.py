@@ -0,0 +1,252 @@
+import os
+import logging
+import threading
+from datetime import timedelta
+
+from sqlalchemy import func, select, delete, text
+from models import db, Comparison, ComparisonStats, Product, KaspiResult, SkuSummary, database_now
+
+logger = logging.getLogger(__name__)
+
+# Сравнения старше этого количества дней сворачиваются в сводки по SKU
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", 90))
+
+# Сколько товаров удаляется в одной транзакции
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", 200))
+
+# Интервал фонового запуска в часах (0 - отключено)
+RETENTION_INTERVAL_HOURS = float(os.environ.get("RETENTION_INTERVAL_HOURS", 0))
+
+# Примерный размер служебной части строки и числовых колонок в байтах
+_ROW_OVERHEAD_BYTES = 48
+
+# Ключ advisory lock в PostgreSQL, чтобы свертку выполнял только один воркер
+_ADVISORY_LOCK_KEY = 26026
+
+# Длина текстовых колонок результата Kaspi - основная часть освобождаемого места
+_RESULT_TEXT_BYTES = (
+    func.coalesce(func.length(KaspiResult.kaspi_name), 0)
+    + func.coalesce(func.length(KaspiResult.sellers), 0)
+    + func.coalesce(func.length(KaspiResult.kaspi_url), 0)
+    + func.coalesce(func.length(KaspiResult.price_details), 0)
+)
+
+
+def _merge_into_summary(summary, row, seen_at):
+    """Add one product observation to a per-SKU summary"""
+    our_price = row.our_price or 0
+    summary.observations = (summary.observations or 0) + 1
+    summary.our_price_sum = (summary.our_price_sum or 0) + our_price
+    summary.our_price_min = our_price if summary.our_price_min is None else min(summary.our_price_min, our_price)
+    summary.our_price_max = our_price if summary.our_price_max is None else max(summary.our_price_max, our_price)
+
+    if row.kaspi_price is not None:
+        summary.kaspi_observations = (summary.kaspi_observations or 0) + 1
+        summary.kaspi_price_sum = (summary.kaspi_price_sum or 0) + row.kaspi_price
+        summary.kaspi_price_min = row.kaspi_price if summary.kaspi_price_min is None else min(summary.kaspi_price_min, row.kaspi_price)
+        summary.kaspi_price_max = row.kaspi_price if summary.kaspi_price_max is None else max(summary.kaspi_price_max, row.kaspi_price)
+
+    if summary.first_seen is None or (seen_at and seen_at < summary.first_seen):
+        summary.first_seen = seen_at
+    # Последние значения обновляем только если наблюдение не старее уже свернутого
+    if summary.last_seen is None or (seen_at and seen_at >= summary.last_seen):
+        summary.last_seen = seen_at
+        summary.model = row.model
+        summary.last_our_price = our_price
+        summary.last_kaspi_price = row.kaspi_price
+
+
+def _compact_product_batch(comparison, batch_size):
+    """
+    Roll up and delete one batch of products of a comparison in a single transaction
+
+    Returns:
+        Tuple (products_deleted, results_deleted, estimated_bytes)
+    """
+    rows = db.session.execute(
+        select(
+            Product.id,
+            Product.sku,
+            Product.model,
+            Product.our_price,
+            func.min(KaspiResult.kaspi_price).label('kaspi_price'),
+            func.count(KaspiResult.id).label('results_count'),
+            func.coalesce(func.sum(_RESULT_TEXT_BYTES), 0).label('results_text_bytes')
+        )
+        .outerjoin(KaspiResult, KaspiResult.product_id == Product.id)
+        .where(Product.comparison_id == comparison.id)
+        .group_by(Product.id, Product.sku, Product.model, Product.our_price)
+        .order_by(Product.id)
+        .limit(batch_size)
+    ).all()
+
+    if not rows:
+        return 0, 0, 0
+
+    skus = {row.sku or '' for row in rows}
+    summaries = {
+        s.sku: s for s in SkuSummary.query.filter(SkuSummary.sku.in_(skus)).all()
+    }
+
+    estimated_bytes = 0
+    results_deleted = 0
+    for row in rows:
+        sku = row.sku or ''
+        summary = summaries.get(sku)
+        if summary is None:
+            summary = SkuSummary(sku=sku)
+            db.session.add(summary)
+            summaries[sku] = summary
+        _merge_into_summary(summary, row, comparison.created_at)
+
+        results_deleted += row.results_count
+        estimated_bytes += (
+            _ROW_OVERHEAD_BYTES + len(row.sku or '') + len(row.model or '')
+            + row.results_count * _ROW_OVERHEAD_BYTES + int(row.results_text_bytes or 0)
+        )
+
+    product_ids = [row.id for row in rows]
+    db.session.execute(delete(KaspiResult).where(KaspiResult.product_id.in_(product_ids)))
+    db.session.execute(delete(Product).where(Product.id.in_(product_ids)))
+    db.session.commit()
+
+    return len(rows), results_deleted, estimated_bytes
+
+
+def _estimate_compaction(comparisons):
+    """
+    Count rows and estimate bytes a compaction of `comparisons` would delete
+
+    Uses the same estimate as the batches of a real run.
+
+    Returns:
+        Tuple (products, results, estimated_bytes)
+    """
+    comparison_ids = [c.id for c in comparisons]
+    estimated_bytes = sum(_ROW_OVERHEAD_BYTES + len(c.filename or '') for c in comparisons)
+    if not comparison_ids:
+        return 0, 0, estimated_bytes
+
+    products, product_bytes = db.session.execute(
+        select(
+            func.count(Product.id),
+            func.coalesce(func.sum(
+                func.coalesce(func.length(Product.sku), 0) + func.coalesce(func.length(Product.model), 0)
+            ), 0)
+        )
+        .where(Product.comparison_id.in_(comparison_ids))
+    ).one()
+    results, results_bytes = db.session.execute(
+        select(func.count(KaspiResult.id), func.coalesce(func.sum(_RESULT_TEXT_BYTES), 0))
+        .join(Product, KaspiResult.product_id == Product.id)
+        .where(Product.comparison_id.in_(comparison_ids))
+    ).one()
+    estimated_bytes += (products + results) * _ROW_OVERHEAD_BYTES + int(product_bytes) + int(results_bytes)
+    return products, results, estimated_bytes
+
+
+def compact_old_comparisons(days=None, batch_size=None, dry_run=False):
+    """
+    Roll up comparisons older than `days` into per-SKU summaries and delete the detailed rows
+
+    Each batch of products is summarized and deleted in its own short transaction,
+    so an interrupted run can simply be restarted without double counting.
+
+    Args:
+        days: Age threshold in days (defaults to RETENTION_DAYS)
+        batch_size: Number of products per transaction (defaults to RETENTION_BATCH_SIZE)
+        dry_run: Only report what would be compacted
+
+    Returns:
+        Dictionary with counts of deleted rows and estimated reclaimed bytes
+    """
+    days = RETENTION_DAYS if days is None else days
+    batch_size = batch_size or RETENTION_BATCH_SIZE
+    # created_at заполняется часами базы, от них и отсчитываем возраст
+    cutoff = database_now() - timedelta(days=days)
+
+    comparisons = Comparison.query.filter(Comparison.created_at < cutoff).order_by(Comparison.created_at).all()
+    report = {
+        "cutoff": cutoff.isoformat(),
+        "comparisons": len(comparisons),
+        "products_deleted": 0,
+        "results_deleted": 0,
+        "estimated_bytes_reclaimed": 0,
+        "dry_run": dry_run
+    }
+
+    if dry_run:
+        products, results, estimated_bytes = _estimate_compaction(comparisons)
+        report["products_deleted"] = products
+        report["results_deleted"] = results
+        report["estimated_bytes_reclaimed"] = estimated_bytes
+        db.session.rollback()
+        return report
+
+    logger.info(f"Compacting {len(comparisons)} comparisons older than {cutoff.isoformat()}")
+
+    for comparison in comparisons:
+        comparison_id = comparison.id
+        filename_bytes = len(comparison.filename or '')
+        while True:
+            products, results, estimated_bytes = _compact_product_batch(comparison, batch_size)
+            if not products:
+                break
+            report["products_deleted"] += products
+            report["results_deleted"] += results
+            report["estimated_bytes_reclaimed"] += estimated_bytes
+
+        db.session.execute(delete(ComparisonStats).where(ComparisonStats.comparison_id == comparison_id))
+        db.session.execute(delete(Comparison).where(Comparison.id == comparison_id))
+        db.session.commit()
+        report["estimated_bytes_reclaimed"] += _ROW_OVERHEAD_BYTES + filename_bytes
+        logger.info(f"Compacted comparison #{comparison_id}")
+
+    logger.info(
+        f"Retention completed: {report['comparisons']} comparisons, {report['products_deleted']} products, "
+        f"{report['results_deleted']} results, ~{report['estimated_bytes_reclaimed']} bytes reclaimed"
+    )
+    return report
+
+
+def run_retention_once(app, **kwargs):
+    """Run compaction inside an app context, guarded by an advisory lock on PostgreSQL"""
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            return compact_old_comparisons(**kwargs)
+
+        # Держим блокировку на отдельном соединении, пока идет свертка
+        with db.engine.connect() as lock_conn:
+            acquired = lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY}).scalar()
+            if not acquired:
+                logger.info("Retention is already running in another worker, skipping")
+                return None
+            try:
+                return compact_old_comparisons(**kwargs)
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+
+
+def start_retention_scheduler(app, interval_hours=None):
+    """
+    Start a daemon thread that periodically compacts old comparisons
+
+    Does nothing when the interval is 0 (the default).
+    """
+    interval_hours = RETENTION_INTERVAL_HOURS if interval_hours is None else interval_hours
+    if not interval_hours or interval_hours <= 0:
+        return None
+
+    stop_event = threading.Event()
+
+    def _loop():
+        while not stop_event.wait(interval_hours * 3600):
+            try:
+                run_retention_once(app)
+            except Exception as e:
+                logger.error(f"Error in scheduled retention: {str(e)}")
+
+    thread = threading.Thread(target=_loop, name="retention-scheduler", daemon=True)
+    thread.start()
+    logger.info(f"Retention scheduler started, interval {interval_hours}h")
+    return stop_event
@@ -0,0 +1,112 @@
+import json
+import logging
+import statistics
+
+from sqlalchemy import func, select, case
+from models import db, Comparison, ComparisonStats, Product, KaspiResult
+
+logger = logging.getLogger(__name__)
+
+# Если анализ рынка не удался, parser возвращает запасной результат с нашим магазином
+# единственным продавцом и разницей 0 - это не данные рынка, в статистике он не учитывается
+_FALLBACK_SELLERS = ("AIKOS",)
+
+# Разница цены результата Kaspi, NULL для запасного результата
+_MARKET_DIFF = case(
+    (func.coalesce(KaspiResult.sellers, '') != json.dumps(list(_FALLBACK_SELLERS)),
+     KaspiResult.price_difference_percent)
+)
+
+
+class StatsAccumulator:
+    """
+    Collect per-product price differences and reduce them to comparison statistics
+
+    The difference of a product is the lowest price_difference_percent among its
+    Kaspi results: below zero means someone on the market is cheaper than us.
+    Fallback results of a failed market analysis are not counted.
+    """
+    __slots__ = ('diffs',)
+
+    def __init__(self):
+        self.diffs = []
+
+    def add_diff(self, diff):
+        if diff is not None:
+            self.diffs.append(diff)
+
+    def add_item(self, item):
+        """Add a ScanItem record"""
+        diffs = [r.price_difference_percent for r in item.kaspi_results
+                 if r.price_difference_percent is not None and tuple(r.sellers) != _FALLBACK_SELLERS]
+        self.add_diff(min(diffs) if diffs else None)
+
+    def result(self):
+        diffs = self.diffs
+        if not diffs:
+            return {
+                "with_market_count": 0,
+                "cheapest_count": 0,
+                "above_market_count": 0,
+                "avg_diff_percent": None,
+                "median_diff_percent": None,
+                "min_diff_percent": None
+            }
+        above = sum(1 for diff in diffs if diff < 0)
+        return {
+            "with_market_count": len(diffs),
+            "cheapest_count": len(diffs) - above,
+            "above_market_count": above,
+            "avg_diff_percent": round(sum(diffs) / len(diffs), 2),
+            "median_diff_percent": round(statistics.median(diffs), 2),
+            "min_diff_percent": min(diffs)
+        }
+
+
+def compute_comparison_stats(comparison_id):
+    """Compute statistics of a saved comparison from its products and Kaspi results"""
+    accumulator = StatsAccumulator()
+    rows = db.session.execute(
+        select(func.min(_MARKET_DIFF))
+        .select_from(Product)
+        .outerjoin(KaspiResult, KaspiResult.product_id == Product.id)
+        .where(Product.comparison_id == comparison_id)
+        .group_by(Product.id)
+    ).scalars()
+    for diff in rows:
+        accumulator.add_diff(diff)
+    return accumulator.result()
+
+
+def backfill_comparison_stats(force=False, batch_size=100):
+    """
+    Compute statistics for comparisons saved before they were collected
+
+    Args:
+        force: Recompute statistics for all comparisons
+        batch_size: Number of comparisons committed per transaction
+
+    Returns:
+        Number of comparisons processed
+    """
+    query = db.session.query(Comparison.id)
+    if not force:
+        query = query.outerjoin(ComparisonStats).filter(ComparisonStats.comparison_id.is_(None))
+    comparison_ids = [row.id for row in query.order_by(Comparison.id).all()]
+
+    for index, comparison_id in enumerate(comparison_ids, start=1):
+        values = compute_comparison_stats(comparison_id)
+        stats = db.session.get(ComparisonStats, comparison_id)
+        if stats is None:
+            stats = ComparisonStats(comparison_id=comparison_id)
+            db.session.add(stats)
+        for key, value in values.items():
+            setattr(stats, key, value)
+        stats.computed_at = func.now()
+        if index % batch_size == 0:
+            db.session.commit()
+            logger.info(f"Backfilled statistics for {index}/{len(comparison_ids)} comparisons")
+
+    db.session.commit()
+    logger.info(f"Backfilled statistics for {len(comparison_ids)} comparisons")
+    return len(comparison_ids)
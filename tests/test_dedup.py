@@ -0,0 +1,57 @@
+import io
+from datetime import timedelta
+
+import pytest
+
+from main import create_app
+from models import db, Comparison, database_now
+
+FEED = (b'<?xml version="1.0" encoding="UTF-8"?><products>'
+        b'<item><sku>S1</sku><model>Michelin Pilot Sport 4 205/55R16</model>'
+        b'<price>45000</price><stock>3</stock></item></products>')
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Анализ рынка пишет кэш в текущий каталог
+    monkeypatch.chdir(tmp_path)
+    app = create_app(config={"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+                             "DEDUP_WINDOW_SECONDS": 3600},
+                     start_scheduler=False)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _upload(client):
+    response = client.post('/scan', data={"file": (io.BytesIO(FEED), "feed.xml")},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    return response.get_json()[0]["comparison_id"]
+
+
+def test_upload_within_window_returns_existing_comparison(app):
+    client = app.test_client()
+
+    first = _upload(client)
+    second = _upload(client)
+
+    assert second == first
+    with app.app_context():
+        assert Comparison.query.count() == 1
+
+
+def test_upload_after_window_creates_new_comparison(app):
+    client = app.test_client()
+    first = _upload(client)
+    with app.app_context():
+        comparison = db.session.get(Comparison, first)
+        comparison.created_at = database_now() - timedelta(seconds=3601)
+        db.session.commit()
+
+    second = _upload(client)
+
+    assert second != first
+    with app.app_context():
+        assert db.session.get(Comparison, first).upload_key is None
+        assert db.session.get(Comparison, second).upload_key is not None
@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import random
+import subprocess
+
+import pytest
+
+from matching import ListingIndex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BRANDS = ["Nokian", "Pirelli", "Continental", "Goodyear", "Yokohama", "Hankook", "Kumho", "Toyo"]
+
+
+def crowded_catalog():
+    """Many listings sharing either the size or the model line of the exact listing"""
+    records = [{"id": f"w{idx}", "name": f"{BRANDS[idx % len(BRANDS)]} Winter {idx} 205/55R16"}
+               for idx in range(400)]
+    sizes = [f"{width}/{profile}R{rim}" for width in range(155, 305, 10) for profile in range(35, 75, 5)
+             for rim in range(13, 23)]
+    sizes.remove("205/55R16")
+    records += [{"id": f"m{idx}", "name": f"Michelin Pilot Sport 4 {size}"} for idx, size in enumerate(sizes[:400])]
+    records.append({"id": "exact", "name": "Michelin Pilot Sport 4 205/55R16"})
+    return records
+
+
+def test_search_finds_exact_listing_among_similar_ones():
+    index = ListingIndex()
+    index.update(crowded_catalog())
+
+    best = index.search("Michelin Pilot Sport 4 205/55R16", k=3)
+
+    assert best[0]["listing_id"] == "exact"
+    assert best[0]["score"] == 1.0
+    assert best[1]["score"] < 1.0
+
+
+@pytest.mark.parametrize("hash_seed", ["1", "2", "3", "4", "5", "6", "7", "8"])
+def test_search_does_not_depend_on_hash_order(hash_seed):
+    # Порядок элементов множеств зависит от PYTHONHASHSEED, поэтому проверяем в отдельных процессах
+    script = ("from tests.test_matching import crowded_catalog\n"
+              "from matching import ListingIndex\n"
+              "index = ListingIndex()\n"
+              "index.update(crowded_catalog())\n"
+              "print(index.search('Michelin Pilot Sport 4 205/55R16', k=1)[0]['listing_id'])\n")
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True,
+                            env={**os.environ, "PYTHONHASHSEED": hash_seed, "PYTHONPATH": ROOT})
+
+    assert output.stdout.strip() == "exact"
+
+
+def test_search_tolerates_typo_and_extra_words():
+    index = ListingIndex()
+    index.update(crowded_catalog())
+
+    assert index.search("Шина Michelln Pilot Sport 4 205/55 R16 летняя", k=1)[0]["listing_id"] == "exact"
+
+
+def test_update_prune_and_deleted_records():
+    index = ListingIndex()
+    index.update([{"id": 1, "name": "Michelin Pilot Sport 4 205/55R16"},
+                  {"id": 2, "name": "Nokian Hakkapeliitta 9 205/55R16"},
+                  {"id": 3, "name": "Pirelli Ice Zero 2 215/60R17"}])
+
+    count = index.update([{"id": 1, "name": "Michelin Pilot Sport 5 205/55R16"},
+                          {"id": 2, "deleted": True}], prune=True)
+
+    assert count == 1
+    assert 2 not in index and 3 not in index
+    assert index.get(1)["name"] == "Michelin Pilot Sport 5 205/55R16"
+    assert [r["listing_id"] for r in index.search("Nokian Hakkapeliitta 9 205/55R16")] == ["1"]
+    assert [r["listing_id"] for r in index.search("Pirelli Ice Zero 2 215/60R17")] == ["1"]
+    # Списки признаков удаленных и переименованных листингов очищены
+    assert not any(listing_id in {"2", "3"} for posting in index._postings.values() for listing_id in posting)
+    assert "t:4" not in index._postings
+
+
+def test_update_without_prune_keeps_absent_listings():
+    index = ListingIndex()
+    index.update([{"id": 1, "name": "Michelin Pilot Sport 4 205/55R16"}])
+
+    index.update([{"id": 2, "name": "Nokian Hakkapeliitta 9 205/55R16"}])
+
+    assert 1 in index and 2 in index
+
+
+def test_search_is_sub_millisecond():
+    # Полный замер на 100 тыс. листингов - benchmarks/bench_matching.py
+    sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+    from bench_matching import generate_catalog
+
+    rng = random.Random(1)
+    catalog = generate_catalog(20000, rng)
+    index = ListingIndex()
+    index.update(catalog)
+    names = [rng.choice(catalog)["name"] for _ in range(300)]
+
+    timings = []
+    for name in names:
+        started = time.perf_counter()
+        index.search(name, k=5)
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    assert timings[len(timings) // 2] < 0.001
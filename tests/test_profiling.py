@@ -0,0 +1,50 @@
+import threading
+
+import profiling
+from profiling import StackSampler, follow_thread
+
+
+def _busy_analysis(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def _run_worker(sampler, register_from_profiled_thread):
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_analysis, args=(stop,), name="scan-analysis-test")
+    profiling._active_sampler = sampler
+    try:
+        worker.start()
+        if register_from_profiled_thread:
+            follow_thread(worker)
+        else:
+            other = threading.Thread(target=follow_thread, args=(worker,))
+            other.start()
+            other.join()
+        sampler.start()
+        # Поток запроса ждет, как при чтении очереди конвейера
+        threading.Event().wait(0.2)
+        sampler.stop()
+    finally:
+        profiling._active_sampler = None
+        stop.set()
+        worker.join()
+    return sampler.report()
+
+
+def test_sampler_follows_worker_thread_of_profiled_request():
+    report = _run_worker(StackSampler(threading.get_ident(), interval_ms=2), register_from_profiled_thread=True)
+
+    worker = report["threads"]["scan-analysis-test"]
+    assert worker["samples"] > 0
+    assert any("_busy_analysis" in entry["function"] for entry in report["hottest_cumulative"])
+    # Ожидание потока запроса не считается горячим кодом
+    request = report["threads"]["request"]
+    assert request["idle_samples"] > 0
+    assert request["samples"] < request["idle_samples"]
+
+
+def test_follow_thread_ignores_threads_of_other_requests():
+    report = _run_worker(StackSampler(threading.get_ident(), interval_ms=2), register_from_profiled_thread=False)
+
+    assert "scan-analysis-test" not in report["threads"]
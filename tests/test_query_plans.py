@@ -0,0 +1,40 @@
+import os
+
+import pytest
+from alembic import command
+from alembic.config import Config
+
+from main import create_app
+from query_plans import explain_hot_paths
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(config={"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}"},
+                     start_scheduler=False)
+    with app.app_context():
+        yield app
+
+
+def _upgrade(revision):
+    command.upgrade(Config(os.path.join(ROOT, 'alembic.ini')), revision)
+
+
+def test_migrated_schema_has_no_sequential_scans(app):
+    _upgrade('head')
+
+    reports = explain_hot_paths()
+
+    assert reports
+    assert [(report["name"], report["sequential_scans"]) for report in reports if report["sequential_scans"]] == []
+
+
+def test_schema_without_indexes_reports_sequential_scans(app):
+    # Без индексов последней миграции проверка должна находить полные проходы
+    _upgrade('8a4e6b2c5d21')
+
+    scans = {table for report in explain_hot_paths() for table in report["sequential_scans"]}
+
+    assert {'products', 'kaspi_results'} <= scans
@@ -0,0 +1,44 @@
+import pytest
+
+from main import create_app
+from models import db, Comparison, Product, KaspiResult
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = create_app(config={"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}"},
+                     start_scheduler=False)
+    with app.app_context():
+        db.create_all()
+        comparison = Comparison(filename="test.xml", products_count=1)
+        product = Product(sku="S1", model="Model", our_price=1000, stock=1)
+        result = KaspiResult(kaspi_name="Model")
+        result.set_price_details([{"seller": "X", "price": 900}])
+        product.kaspi_results.append(result)
+        comparison.products.append(product)
+        db.session.add(comparison)
+        db.session.commit()
+    return app.test_client()
+
+
+@pytest.mark.parametrize("body", [[1, 2], "text", {"costs": [1, 2]}, {"costs": "S1"}, {"undercut": "abc"},
+                                  {"costs": {"S1": "nan"}}, {"undercut": "inf"}])
+def test_reprice_rejects_malformed_body(client, body):
+    response = client.post('/api/comparison/1/reprice', json=body)
+    assert response.status_code == 400
+    assert "Invalid repricing rules" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("raw", ['{"costs": {"S1": NaN}}', '{"undercut": Infinity}', '{"round_to": -Infinity}'])
+def test_reprice_rejects_non_finite_json_numbers(client, raw):
+    response = client.post('/api/comparison/1/reprice', data=raw, content_type='application/json')
+    assert response.status_code == 400
+    assert "finite" in response.get_json()["error"]
+
+
+def test_reprice_applies_costs(client):
+    response = client.post('/api/comparison/1/reprice', json={"costs": {"S1": 1000}, "min_margin_percent": 10})
+    assert response.status_code == 200
+    [item] = response.get_json()["items"]
+    assert item["reason"] == "margin_floor"
+    assert item["recommended_price"] == 1100.0
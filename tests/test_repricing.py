@@ -0,0 +1,100 @@
+import pytest
+
+from models import db, Comparison, Product, KaspiResult
+from repricing import RepricingRules, load_pricing_columns, reprice_comparison, parse_costs, build_price_xml
+
+
+def _add_product(comparison_id, sku, our_price, results):
+    """Product with one KaspiResult per entry; None stores a NULL price_details"""
+    product = Product(comparison_id=comparison_id, sku=sku, model=f"Model {sku}", our_price=our_price, stock=5)
+    for details in results:
+        result = KaspiResult(kaspi_name=f"Model {sku}")
+        if details is not None:
+            result.set_price_details(details)
+        product.kaspi_results.append(result)
+    db.session.add(product)
+
+
+def _comparison():
+    comparison = Comparison(filename="test.xml", products_count=0)
+    db.session.add(comparison)
+    db.session.flush()
+    return comparison.id
+
+
+def test_load_pricing_columns_merges_several_results_per_product(app):
+    comparison_id = _comparison()
+    _add_product(comparison_id, "S1", 1000, [[{"seller": "X", "price": 900}], []])
+    _add_product(comparison_id, "S2", 1000, [[], [{"seller": "Y", "price": 800}]])
+    _add_product(comparison_id, "S3", 1000, [[{"seller": "A", "price": 950}], None, [{"seller": "B", "price": 940}]])
+    _add_product(comparison_id, "S4", 1000, [[{"seller": "C", "price": 990}]])
+    _add_product(comparison_id, "S5", 1000, [])
+    db.session.commit()
+
+    skus, _, _, _, details = load_pricing_columns(comparison_id)
+
+    assert skus == ["S1", "S2", "S3", "S4", "S5"]
+    assert details == [
+        [{"seller": "X", "price": 900}],
+        [{"seller": "Y", "price": 800}],
+        [{"seller": "A", "price": 950}, {"seller": "B", "price": 940}],
+        [{"seller": "C", "price": 990}],
+        []
+    ]
+
+
+def test_load_pricing_columns_keeps_valid_rows_when_one_is_corrupt(app):
+    comparison_id = _comparison()
+    _add_product(comparison_id, "S1", 1000, [[{"seller": "X", "price": 900}]])
+    _add_product(comparison_id, "S2", 1000, [[{"seller": "Y", "price": 800}]])
+    db.session.commit()
+    db.session.execute(KaspiResult.__table__.update()
+                       .where(KaspiResult.product_id == Product.id, Product.sku == "S2")
+                       .values(price_details="[{broken"))
+    db.session.commit()
+
+    _, _, _, _, details = load_pricing_columns(comparison_id)
+
+    assert details == [[{"seller": "X", "price": 900}], []]
+
+
+def test_reprice_undercuts_competitor_from_any_result(app):
+    comparison_id = _comparison()
+    _add_product(comparison_id, "S1", 1000, [[{"seller": "X", "price": 900}], []])
+    db.session.commit()
+
+    [recommendation] = reprice_comparison(comparison_id, RepricingRules(undercut=100, round_to=100))
+
+    assert recommendation.reason == "undercut"
+    assert recommendation.competitor == "X"
+    assert recommendation.recommended_price == 800.0
+
+
+def test_reprice_never_recommends_non_positive_prices(app):
+    comparison_id = _comparison()
+    _add_product(comparison_id, "S1", 1000, [[{"seller": "X", "price": 900}]])
+    _add_product(comparison_id, "S2", 0, [])
+    _add_product(comparison_id, "S3", 500, [])
+    db.session.commit()
+
+    recommendations = reprice_comparison(comparison_id, RepricingRules(undercut=1000000, round_to=100))
+
+    assert [(r.reason, r.recommended_price) for r in recommendations] == [
+        ("undercut", 100.0), ("invalid_price", 0.0), ("no_competitors", 500.0)
+    ]
+    xml = build_price_xml(recommendations).decode('utf-8')
+    assert 'sku="S2"' not in xml
+    assert '<price>100</price>' in xml and '<price>500</price>' in xml
+
+
+@pytest.mark.parametrize("rules", [{"undercut": "inf"}, {"undercut": float("nan")}, {"min_margin_percent": "nan"},
+                                   {"round_to": float("inf")}, {"round_to": -100}, {"min_seller_stock": "inf"}])
+def test_rules_reject_non_finite_numbers(rules):
+    with pytest.raises(ValueError):
+        RepricingRules.from_dict(rules)
+
+
+@pytest.mark.parametrize("costs", [{"S1": "nan"}, {"S1": float("inf")}, {"S1": "-Infinity"}, ["S1"]])
+def test_parse_costs_rejects_invalid_costs(costs):
+    with pytest.raises(ValueError):
+        parse_costs(costs)
@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+
+import pytest
+
+from models import db, Comparison, Product, KaspiResult, SkuSummary, database_now
+from retention import compact_old_comparisons, _compact_product_batch
+
+
+def _add_comparison(age, products):
+    """Comparison created `age` ago by the database clock; products are (sku, our_price, kaspi_price)"""
+    comparison = Comparison(filename=f"feed-{age.days}.xml", products_count=len(products),
+                            created_at=database_now() - age)
+    for sku, our_price, kaspi_price in products:
+        product = Product(sku=sku, model=f"Model {sku}", our_price=our_price, stock=1)
+        result = KaspiResult(kaspi_name=f"Model {sku}", kaspi_price=kaspi_price, kaspi_url="https://kaspi.kz/x")
+        result.set_price_details([{"seller": "X", "price": kaspi_price}])
+        product.kaspi_results.append(result)
+        comparison.products.append(product)
+    db.session.add(comparison)
+    db.session.commit()
+    return comparison
+
+
+@pytest.fixture
+def history(app):
+    old = _add_comparison(timedelta(days=100), [("A", 1000, 900), ("B", 2000, 1900), ("C", 500, 450)])
+    older = _add_comparison(timedelta(days=120), [("A", 1100, 950)])
+    recent = _add_comparison(timedelta(days=1), [("A", 1200, 1000)])
+    return old.id, older.id, recent.id
+
+
+def _summaries():
+    return {s.sku: (s.observations, s.our_price_min, s.our_price_max, s.last_our_price, s.kaspi_observations)
+            for s in SkuSummary.query.all()}
+
+
+def test_compaction_in_batches_of_one(history):
+    _, _, recent_id = history
+
+    report = compact_old_comparisons(days=90, batch_size=1)
+
+    assert report["comparisons"] == 2
+    assert report["products_deleted"] == 4
+    assert report["results_deleted"] == 4
+    assert _summaries() == {
+        "A": (2, 1000, 1100, 1000, 2),
+        "B": (1, 2000, 2000, 2000, 1),
+        "C": (1, 500, 500, 500, 1),
+    }
+    assert [c.id for c in Comparison.query.all()] == [recent_id]
+    assert Product.query.count() == 1
+    assert KaspiResult.query.count() == 1
+
+
+def test_dry_run_reports_the_same_estimate(history):
+    dry = compact_old_comparisons(days=90, dry_run=True)
+
+    assert Product.query.count() == 5
+    assert SkuSummary.query.count() == 0
+
+    real = compact_old_comparisons(days=90, batch_size=1)
+
+    assert dry["estimated_bytes_reclaimed"] > 0
+    for key in ("comparisons", "products_deleted", "results_deleted", "estimated_bytes_reclaimed"):
+        assert dry[key] == real[key]
+
+
+def test_interrupted_compaction_restarts_without_double_counting(history):
+    old_id, _, _ = history
+    # Первый запуск успел свернуть только один товар
+    _compact_product_batch(db.session.get(Comparison, old_id), 1)
+
+    compact_old_comparisons(days=90, batch_size=1)
+    compact_old_comparisons(days=90, batch_size=1)
+
+    assert _summaries()["A"] == (2, 1000, 1100, 1000, 2)
+    assert sum(s.observations for s in SkuSummary.query.all()) == 4
+    assert Comparison.query.count() == 1
+
+
+def test_cutoff_uses_database_clock(app, monkeypatch):
+    # Процесс в UTC-5, SQLite хранит created_at в UTC: по местным часам сравнение "из будущего"
+    monkeypatch.setenv("TZ", "Etc/GMT+5")
+    time.tzset()
+    try:
+        _add_comparison(timedelta(hours=2), [("A", 1000, 900)])
+
+        report = compact_old_comparisons(days=0)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+    assert report["comparisons"] == 1
+    assert Comparison.query.count() == 0
@@ -0,0 +1,50 @@
+from models import db, Comparison
+from pipeline import build_product
+from records import MarketResult, SellerPrice, ScanItem
+from stats import StatsAccumulator, compute_comparison_stats
+
+
+def _market(diff):
+    return MarketResult(kaspi_name="Model", kaspi_price=900.0, sellers=["AIKOS", "X"],
+                        price_details=[SellerPrice("X", 900, diff)], price_difference_percent=diff)
+
+
+def _fallback():
+    # Так parser отвечает, если анализ рынка не удался
+    return MarketResult(kaspi_name="Model", kaspi_price=1000.0, sellers=["AIKOS"], price_difference_percent=0)
+
+
+def _items():
+    return [
+        ScanItem("S1", "Model", 1000.0, 1, [_market(-10.0)]),
+        ScanItem("S2", "Model", 1000.0, 1, [_fallback()]),
+        ScanItem("S3", "Model", 1000.0, 1, [_fallback(), _market(5.0)]),
+    ]
+
+
+EXPECTED = {
+    "with_market_count": 2,
+    "cheapest_count": 1,
+    "above_market_count": 1,
+    "avg_diff_percent": -2.5,
+    "median_diff_percent": -2.5,
+    "min_diff_percent": -10.0
+}
+
+
+def test_accumulator_skips_fallback_results():
+    accumulator = StatsAccumulator()
+    for item in _items():
+        accumulator.add_item(item)
+
+    assert accumulator.result() == EXPECTED
+
+
+def test_saved_comparison_stats_skip_fallback_results(app):
+    comparison = Comparison(filename="test.xml", products_count=3)
+    db.session.add(comparison)
+    db.session.flush()
+    db.session.add_all([build_product(comparison.id, item) for item in _items()])
+    db.session.commit()
+
+    assert compute_comparison_stats(comparison.id) == EXPECTED